@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+import logging
+import asyncpg
+from contextlib import asynccontextmanager
+
+from db import DATABASE_URL, OptimizedQuest, QuestEnemiesTraits
+
+# Database access of the bot, on its event loop. asyncpg prepares and caches `STATEMENTS` per connection.
+POOL_MIN_CONNECTIONS = int(os.environ.get("DB_POOL_MIN", "4")) # Opened at start
+POOL_MAX_CONNECTIONS = int(os.environ.get("DB_POOL_MAX", "8")) # Checkouts past this wait for a free connection
+QUEST_ENEMIES_FETCH_SIZE = 5000 # Rows per round trip of the quest enemies cursor
+REGION_CACHE_TTL = float(os.environ.get("REGION_CACHE_TTL", "0")) # Seconds before a cached region is read again, 0 to keep it until changed
+
+REGIONS_TABLE = "CREATE TABLE IF NOT EXISTS regions(guild_id BIGINT PRIMARY KEY, region VARCHAR(2))"
+OPTIMIZED_QUESTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS optimized_quests
+    (
+        master_mission_id bigint NOT NULL,
+        quest_id bigint NOT NULL,
+        target_id character varying NOT NULL,
+        target_count bigint NOT NULL,
+        region character varying(2),
+        "count" bigint NOT NULL,
+        is_or boolean NOT NULL DEFAULT false,
+        CONSTRAINT optimized_quests_pkey PRIMARY KEY (master_mission_id, quest_id, target_id)
+    )
+    """
+
+STATEMENTS = {
+    "set_region": "INSERT INTO regions(guild_id, region) VALUES ($1, $2) ON CONFLICT (guild_id) DO UPDATE SET region = EXCLUDED.region",
+    "get_region": "SELECT region FROM regions WHERE guild_id = $1",
+    "get_regions": "SELECT guild_id, region FROM regions",
+    "delete_optimized_quests": "DELETE FROM optimized_quests WHERE region = $1",
+    "get_optimized_quests": """
+        SELECT master_mission_id, quest_id, target_id, target_count, count, is_or
+        FROM optimized_quests
+        WHERE master_mission_id = $1 AND region = $2
+        ORDER BY quest_id
+        """,
+    "insert_optimized_quest": """
+        INSERT INTO optimized_quests(master_mission_id, quest_id, target_id, target_count, count, is_or, region)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """,
+    "get_quests_enemies": """
+        SELECT quest_id, quest_enemies.enemy_id, enemy_count, trait_id
+        FROM quest_enemies
+        INNER JOIN enemy_traits ON
+            quest_enemies.enemy_id = enemy_traits.enemy_id
+        WHERE quest_id = ANY($1)
+        ORDER BY quest_id, enemy_id, enemy_count
+        """,
+}
+
+_pool: asyncpg.Pool = None
+_pool_lock = asyncio.Lock()
+_created = 0
+_in_use = 0
+_checkouts = 0
+_waits = 0
+_wait_time = 0
+_max_wait_time = 0
+_regions: dict[int, tuple[str, float]] = {} # Guild ID => (region, cached at)
+
+
+async def on_connect(conn: asyncpg.Connection):
+    global _created
+    _created += 1
+
+
+async def get_pool() -> asyncpg.Pool:
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                DATABASE_URL,
+                min_size=POOL_MIN_CONNECTIONS,
+                max_size=POOL_MAX_CONNECTIONS,
+                init=on_connect,
+            )
+    return _pool
+
+
+def get_pool_stats() -> dict:
+    """Gets the pool metrics.
+
+    Returns:
+        dict: Connections created, in use and idle, max size, number of checkouts,
+            checkouts that found every connection in use, total and max wait time (seconds)
+    """
+    return {
+        "created": _created,
+        "in_use": _in_use,
+        "idle": _pool.get_idle_size() if _pool else 0,
+        "max": POOL_MAX_CONNECTIONS,
+        "checkouts": _checkouts,
+        "waits": _waits,
+        "wait_time": _wait_time,
+        "max_wait_time": _max_wait_time,
+    }
+
+
+@asynccontextmanager
+async def get_connection():
+    """Checks out a pooled connection, waiting for a free one if all are in use."""
+    global _in_use, _checkouts, _waits, _wait_time, _max_wait_time
+    pool = await get_pool()
+    exhausted = pool.get_idle_size() == 0 and pool.get_size() >= POOL_MAX_CONNECTIONS
+    start = time.perf_counter()
+    async with pool.acquire() as conn:
+        waited = time.perf_counter() - start
+        _in_use += 1
+        _checkouts += 1
+        _waits += exhausted
+        _wait_time += waited
+        _max_wait_time = max(_max_wait_time, waited)
+        try:
+            yield conn
+        finally:
+            _in_use -= 1
+
+
+def log_pool_stats():
+    logging.getLogger(__name__).info("Connection pool: %s", get_pool_stats())
+
+
+def get_cached_region(guild_id: int) -> str | None:
+    """Gets the region of a guild without going to the database.
+
+    Returns:
+        str: Region, None if it is not cached or has expired
+    """
+    entry = _regions.get(int(guild_id)) # Snowflakes are not equal to the int IDs
+    if entry is None or (REGION_CACHE_TTL > 0 and time.time() - entry[1] >= REGION_CACHE_TTL):
+        return None
+    return entry[0]
+
+
+def cache_region(guild_id: int, region: str):
+    _regions[int(guild_id)] = (region, time.time())
+
+
+async def init_region_db():
+    async with get_connection() as conn:
+        await conn.execute(REGIONS_TABLE)
+
+
+async def load_regions():
+    """Caches the regions of all guilds."""
+    async with get_connection() as conn:
+        rows = await conn.fetch(STATEMENTS["get_regions"])
+    now = time.time()
+    _regions.update({row["guild_id"]: (row["region"], now) for row in rows})
+
+
+async def set_region(guild_id: int, region: str):
+    async with get_connection() as conn:
+        await conn.execute(STATEMENTS["set_region"], int(guild_id), region)
+    cache_region(guild_id, region)
+
+
+async def get_region(guild_id: int):
+    region = get_cached_region(guild_id)
+    if region:
+        return region
+    async with get_connection() as conn:
+        region = await conn.fetchval(STATEMENTS["get_region"], int(guild_id))
+    if region:
+        cache_region(guild_id, region)
+    return region
+
+
+async def init_optimized_quests_db():
+    async with get_connection() as conn:
+        await conn.execute(OPTIMIZED_QUESTS_TABLE)
+
+
+async def insert_optimized_quests(drops: list[OptimizedQuest], region: str = "JP"):
+    async with get_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(STATEMENTS["delete_optimized_quests"], region)
+            await conn.executemany(
+                STATEMENTS["insert_optimized_quest"],
+                # target_id is a varchar column, asyncpg does not cast int parameters to text
+                [(drop.master_mission_id, drop.quest_id, str(drop.target_id), drop.target_count, drop.count, drop.is_or, region) for drop in drops]
+            )
+
+
+async def get_optimized_quests(master_mission_id: int, region: str = "JP"):
+    async with get_connection() as conn:
+        rows = await conn.fetch(STATEMENTS["get_optimized_quests"], master_mission_id, region)
+    if len(rows) > 0:
+        return [OptimizedQuest(*row) for row in rows]
+    return None
+
+
+async def get_quests_enemies(quest_ids: list[int]) -> dict[int, list[QuestEnemiesTraits]]:
+    """Gets the enemies and their traits of many quests in one query.
+    Rows are streamed through a cursor and grouped in a single pass.
+
+    Args:
+        quest_ids (list[int]): Quest IDs
+
+    Returns:
+        dict: Quest ID => enemies, quests without enemies are left out
+    """
+    result: dict[int, list[QuestEnemiesTraits]] = {}
+    if len(quest_ids) == 0:
+        return result
+    async with get_connection() as conn:
+        # Cursors only exist inside a transaction
+        async with conn.transaction():
+            quest_enemies_traits = None
+            async for quest_id, enemy_id, enemy_count, trait_id in conn.cursor(STATEMENTS["get_quests_enemies"], list(quest_ids), prefetch=QUEST_ENEMIES_FETCH_SIZE):
+                if quest_enemies_traits is None or quest_enemies_traits.quest_id != quest_id or quest_enemies_traits.enemy_id != enemy_id:
+                    quest_enemies_traits = QuestEnemiesTraits(quest_id, enemy_id, enemy_count, [])
+                    result.setdefault(quest_id, []).append(quest_enemies_traits)
+                quest_enemies_traits.traits.append(trait_id)
+    return result
@@ -0,0 +1,109 @@
+from bisect import bisect_left
+
+NGRAM_SIZE = 3
+MAX_CHOICES = 24
+
+_indexes: dict[str, "AutocompleteIndex"] = {}
+
+
+def normalize_key(text: str) -> str:
+    return text.upper()
+
+
+def get_ngrams(text: str, size: int) -> set[str]:
+    return set(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+class AutocompleteIndex:
+    """Prefix and substring lookup over autocomplete choices.
+
+    Every choice has one or more search texts, normalized once when the index is built.
+    Substrings up to `NGRAM_SIZE` characters are looked up directly, longer ones
+    through their n-grams and then checked against the normalized texts.
+    Choices with a word starting with the input come first, the rest keep their original order.
+    """
+    names: list[str]
+    values: list[str]
+
+    def __init__(self, choices: list[tuple[str, str, list[str]]]):
+        """
+        Args:
+            choices (list): (Choice name, choice value, search texts)
+        """
+        self.names = []
+        self.values = []
+        self._keys: list[str] = []
+        self._ngrams: dict[str, set[int]] = {}
+        self._words: list[tuple[str, int]] = []
+        for position, (name, value, texts) in enumerate(choices):
+            self.names.append(name)
+            self.values.append(value)
+            key = "\n".join(normalize_key(text) for text in texts if text)
+            self._keys.append(key)
+            for size in range(1, NGRAM_SIZE + 1):
+                for ngram in get_ngrams(key, size):
+                    self._ngrams.setdefault(ngram, set()).add(position)
+            for word in set(key.split()):
+                self._words.append((word, position))
+        self._words.sort()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def find_prefix(self, query: str) -> set[int]:
+        positions = set()
+        for word, position in self._words[bisect_left(self._words, (query,)):]:
+            if not word.startswith(query):
+                break
+            positions.add(position)
+        return positions
+
+    def find_substring(self, query: str) -> set[int]:
+        if len(query) <= NGRAM_SIZE:
+            return self._ngrams.get(query, set())
+        postings = sorted((self._ngrams.get(ngram, set()) for ngram in get_ngrams(query, NGRAM_SIZE)), key=len)
+        if not postings[0]:
+            return set()
+        candidates = postings[0].intersection(*postings[1:])
+        return set(position for position in candidates if query in self._keys[position])
+
+    def search(self, query: str = "", limit: int = MAX_CHOICES) -> list[tuple[str, str]]:
+        """Finds the choices containing the input.
+
+        Args:
+            query (str): User input
+            limit (int, optional): Max number of choices. Defaults to `MAX_CHOICES`.
+
+        Returns:
+            list: (Choice name, choice value)
+        """
+        query = normalize_key(query.strip()) if query else ""
+        if not query:
+            positions = range(min(limit, len(self.names)))
+        else:
+            matches = self.find_substring(query)
+            prefix_matches = self.find_prefix(query) & matches
+            positions = (sorted(prefix_matches) + sorted(matches - prefix_matches))[:limit]
+        return [(self.names[position], self.values[position]) for position in positions]
+
+
+def get_index(name: str, build_fn, *args) -> AutocompleteIndex:
+    """Gets a named index, building it with `build_fn(*args)` on first use.
+
+    Args:
+        name (str): Index name
+        build_fn: Function returning the list of choices (see `AutocompleteIndex`)
+
+    Returns:
+        AutocompleteIndex: Index
+    """
+    index = _indexes.get(name)
+    if index is None:
+        index = AutocompleteIndex(build_fn(*args))
+        _indexes[name] = index
+    return index
+
+
+def set_index(name: str, choices: list[tuple[str, str, list[str]]]):
+    """Replaces a named index (e.g. when its data changed)."""
+    _indexes[name] = AutocompleteIndex(choices)
@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+
+CACHE_MEMORY_BUDGET = int(os.environ.get("CACHE_MEMORY_BUDGET_MB", "64")) * 1024 * 1024
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", "http_cache.sqlite")
+DEFAULT_TTL = 600 # Seconds
+PURGE_INTERVAL = 3600 # Seconds between removing expired entries from disk
+STALE_RETENTION = 86400 # Seconds expired entries are kept on disk for revalidation
+
+# (URL pattern, TTL in seconds), first match wins. A TTL of 0 disables caching.
+TTL_POLICIES: list[tuple[re.Pattern, int]] = [
+    (re.compile(r"^https://api\.atlasacademy\.io/info"), 0), # Data version
+    (re.compile(r"^https://rayshift\.io/api/v1/support/decks/"), 60), # Support decks change at any time
+    (re.compile(r"^https://api\.atlasacademy\.io/nice/\w+/(svt|skill|NP|function|buff|equip|quest)/\d+"), 86400), # Game data by ID, changes only on game updates
+    (re.compile(r"^https://api\.atlasacademy\.io/basic/\w+/.+/search"), 3600), # Search results
+]
+
+
+def get_ttl(url: str) -> int:
+    """Gets the cache TTL for a URL from `TTL_POLICIES`.
+
+    Args:
+        url (str): URL
+
+    Returns:
+        int: TTL in seconds
+    """
+    for pattern, ttl in TTL_POLICIES:
+        if pattern.match(url):
+            return ttl
+    return DEFAULT_TTL
+
+
+class MemoryCache:
+    """LRU of parsed objects, evicted once their total size exceeds the memory budget.
+    Sizes are the length of the response body the object was parsed from.
+    Expired entries are kept until evicted so that they can be revalidated.
+    """
+    budget: int
+    size: int
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, int, object, dict]] = OrderedDict()
+
+    def get(self, key: str):
+        entry = self.peek(key)
+        if entry is None or time.time() >= entry[0]:
+            return None
+        return entry[2]
+
+    def peek(self, key: str) -> tuple[float, int, object, dict] | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value, size: int, expires_at: float, validators: dict = None):
+        if size > self.budget:
+            return
+        self.delete(key)
+        self._entries[key] = (expires_at, size, value, validators or {})
+        self.size += size
+        while self.size > self.budget:
+            _, (_, evicted_size, _, _) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+class DiskCache:
+    """Response bodies and their validators persisted in SQLite so that restarts start warm.
+    Expired rows are kept for a day so that they can be revalidated with a conditional request.
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, body TEXT NOT NULL)")
+        for column in ["etag", "last_modified"]:
+            try:
+                self._conn.execute(f"ALTER TABLE responses ADD COLUMN {column} TEXT")
+            except sqlite3.OperationalError:
+                pass # Column already exists
+        self._conn.commit()
+        self._last_purge = 0
+
+    def get(self, key: str) -> tuple[str, float, dict] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT body, expires_at, etag, last_modified FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], {"etag": row[2], "last_modified": row[3]}
+
+    def set(self, key: str, body: str, expires_at: float, validators: dict = None):
+        validators = validators or {}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, expires_at, body, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+                (key, expires_at, body, validators.get("etag"), validators.get("last_modified"))
+            )
+            if time.time() - self._last_purge >= PURGE_INTERVAL:
+                self._last_purge = time.time()
+                self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time() - STALE_RETENTION,))
+            self._conn.commit()
+
+    def touch(self, key: str, expires_at: float):
+        with self._lock:
+            self._conn.execute("UPDATE responses SET expires_at = ? WHERE key = ?", (expires_at, key))
+            self._conn.commit()
+
+
+class TieredCache:
+    """Memory LRU of parsed JSON, then SQLite on disk. Misses go to the network in http_client.
+    Values in memory are returned as is to every caller, they must not be modified (copy them first).
+    """
+
+    def __init__(self, memory_budget: int = CACHE_MEMORY_BUDGET, disk_path: str = CACHE_DB_PATH):
+        self.memory = MemoryCache(memory_budget)
+        self.disk = DiskCache(disk_path)
+
+    async def get_json(self, key: str):
+        """Gets a cached value that has not expired yet. The value is shared, do not modify it."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        row = await asyncio.to_thread(self.disk.get, key)
+        if row is None or time.time() >= row[1]:
+            return None
+        body, expires_at, validators = row
+        value = json.loads(body)
+        self.memory.set(key, value, len(body), expires_at, validators)
+        return value
+
+    async def get_stale(self, key: str) -> tuple[object, str, dict, int] | None:
+        """Gets an expired entry to revalidate.
+
+        Returns:
+            tuple: Parsed value (None if only the body is on disk), body (None if the value is in memory), validators and size
+        """
+        entry = self.memory.peek(key)
+        if entry is not None and entry[3]:
+            return entry[2], None, entry[3], entry[1]
+        row = await asyncio.to_thread(self.disk.get, key)
+        if row is None or not any(row[2].values()):
+            return None
+        return None, row[0], row[2], len(row[0])
+
+    async def set_json(self, key: str, body: str, value, ttl: int, validators: dict = None):
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self.memory.set(key, value, len(body), expires_at, validators)
+        await asyncio.to_thread(self.disk.set, key, body, expires_at, validators)
+
+    async def touch(self, key: str, value, size: int, ttl: int, validators: dict):
+        """Extends an entry revalidated with a 304 response."""
+        expires_at = time.time() + ttl
+        self.memory.set(key, value, size, expires_at, validators)
+        await asyncio.to_thread(self.disk.touch, key, expires_at)
+
+
+_cache: TieredCache = None
+
+
+def get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        _cache = TieredCache()
+    return _cache
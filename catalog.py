@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import fgo_api_types.nice as nice
+import fgo_api_types.basic as basic
+
+import snapshot
+from autocomplete import AutocompleteIndex
+
+
+def get_item_source(region: str) -> tuple[str, str]:
+    if region == "JP":
+        return ("JP", "nice_item_lang_en.json")
+    return ("NA", "nice_item.json")
+
+
+def get_master_mission_source(region: str) -> tuple[str, str]:
+    return (region, "nice_master_mission.json")
+
+
+class Catalog:
+    """Items, servants and master missions of a region, parsed once per data version."""
+    region: str
+    version: str
+    source: dict[str, list]
+
+    def __init__(self, region: str, version: str, exports: dict[str, list]):
+        self.region = region
+        self.version = version
+        self.source = exports # Export data the catalog is parsed from
+        self._lock = threading.Lock()
+        self._items: list[nice.NiceItem] = None
+        self._items_by_id: dict[int, nice.NiceItem] = None
+        self._items_by_name: dict[str, nice.NiceItem] = None
+        self._servants: list[basic.BasicServant] = None
+        self._servants_by_id: dict[int, basic.BasicServant] = None
+        self._servants_by_name: dict[str, basic.BasicServant] = None
+        self._master_missions: list[nice.NiceMasterMission] = None
+        self._item_search: AutocompleteIndex = None
+
+    def load_items(self):
+        with self._lock:
+            if self._items is not None:
+                return
+            items = [nice.NiceItem.parse_obj(item) for item in self.source["items"]]
+            self._items_by_id = {item.id: item for item in items}
+            self._items_by_name = {}
+            for item in items:
+                self._items_by_name.setdefault(item.name, item)
+            self._items = items
+
+    def load_item_search(self):
+        self.load_items()
+        with self._lock:
+            if self._item_search is not None:
+                return
+            self._item_search = AutocompleteIndex([
+                (item.name, str(item.id), [item.name, str(item.id)])
+                for item in self._items if item.uses and len(item.uses) > 0
+            ])
+
+    def load_servants(self):
+        with self._lock:
+            if self._servants is not None:
+                return
+            servants = [basic.BasicServant.parse_obj(svt) for svt in self.source["servants"]]
+            self._servants_by_id = {svt.id: svt for svt in servants}
+            self._servants_by_name = {}
+            for svt in servants:
+                self._servants_by_name.setdefault(svt.name, svt)
+            self._servants = servants
+
+    def reuse(self, other: "Catalog"):
+        """Takes over the parsed objects of another catalog built from the same (unchanged) export data."""
+        with other._lock, self._lock:
+            if self.source["items"] is other.source["items"] and other._items is not None:
+                self._items = other._items
+                self._items_by_id = other._items_by_id
+                self._items_by_name = other._items_by_name
+                self._item_search = other._item_search
+            if self.source["servants"] is other.source["servants"] and other._servants is not None:
+                self._servants = other._servants
+                self._servants_by_id = other._servants_by_id
+                self._servants_by_name = other._servants_by_name
+            if self.source["master_missions"] is other.source["master_missions"]:
+                self._master_missions = other._master_missions
+
+    def load_all(self):
+        self.load_items()
+        self.load_item_search()
+        self.load_servants()
+        self.master_missions
+
+    @property
+    def items(self) -> list[nice.NiceItem]:
+        self.load_items()
+        return self._items
+
+    @property
+    def items_by_id(self) -> dict[int, nice.NiceItem]:
+        self.load_items()
+        return self._items_by_id
+
+    @property
+    def items_by_name(self) -> dict[str, nice.NiceItem]:
+        self.load_items()
+        return self._items_by_name
+
+    @property
+    def item_search(self) -> AutocompleteIndex:
+        """Autocomplete index of the items that have uses, by name and ID."""
+        self.load_item_search()
+        return self._item_search
+
+    @property
+    def servants(self) -> list[basic.BasicServant]:
+        self.load_servants()
+        return self._servants
+
+    @property
+    def servants_by_id(self) -> dict[int, basic.BasicServant]:
+        self.load_servants()
+        return self._servants_by_id
+
+    @property
+    def servants_by_name(self) -> dict[str, basic.BasicServant]:
+        self.load_servants()
+        return self._servants_by_name
+
+    @property
+    def master_missions(self) -> list[nice.NiceMasterMission]:
+        with self._lock:
+            if self._master_missions is None:
+                self._master_missions = [
+                    nice.NiceMasterMission.parse_obj(mission)
+                    for mission in self.source["master_missions"]
+                ]
+            return self._master_missions
+
+
+def get_sources(region: str) -> dict[str, tuple[str, str]]:
+    return {
+        "items": get_item_source(region),
+        "servants": snapshot.get_servant_source(region, "basic"),
+        "master_missions": get_master_mission_source(region),
+    }
+
+
+async def get_catalog_version(region: str) -> str:
+    source_regions = sorted(set(source[0] for source in get_sources(region).values()))
+    return ",".join(await asyncio.gather(*[snapshot.get_version(source_region) for source_region in source_regions]))
+
+
+async def load_exports(region: str) -> dict[str, list]:
+    sources = get_sources(region)
+    exports = await asyncio.gather(*[snapshot.load_export(*source) for source in sources.values()])
+    return dict(zip(sources.keys(), exports))
+
+
+async def create_catalog(region: str, version: str, exports: dict[str, list], previous: Catalog = None) -> Catalog:
+    catalog = Catalog(region, version, exports)
+    if previous is not None:
+        catalog.reuse(previous)
+    # Parse off the event loop before publishing, so no lookup blocks on the catalog lock
+    await asyncio.to_thread(catalog.load_all)
+    return catalog
+
+
+_catalogs = snapshot.VersionedStore("catalog", get_catalog_version, load_exports, create_catalog)
+
+
+async def get_catalog(region: str = "JP") -> Catalog:
+    """Gets the catalog for a region, see `snapshot.VersionedStore`.
+
+    Args:
+        region (str): Region (Default: JP)
+
+    Returns:
+        Catalog: Catalog for the current (or previous) data version
+    """
+    return await _catalogs.get(region)
+
+
+async def refresh_catalogs():
+    await _catalogs.refresh()
@@ -5,6 +5,7 @@ import configparser
 import fgo_api_types.nice as nice
 from collections import Counter
 
+# Models shared with async_db (used by the bot), and the writes of the offline quest data scripts
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 parser = configparser.ConfigParser()
@@ -13,48 +14,6 @@ if not DATABASE_URL:
     DATABASE_URL = parser.get('Auth', 'DATABASE_URL')
 
 
-def init_region_db():
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        cur.execute('CREATE TABLE IF NOT EXISTS regions(guild_id BIGINT PRIMARY KEY, region VARCHAR(2))')
-
-
-def set_region(guild_id: int, region: str):
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        cur.execute(f'INSERT INTO regions(guild_id, region) values({guild_id}, \'{region}\') ON CONFLICT (guild_id) DO UPDATE SET region=\'{region}\'')
-        conn.commit()
-
-
-def get_region(guild_id: int):
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        cur.execute(f'SELECT region FROM regions WHERE guild_id = {guild_id}')
-        row = cur.fetchone()
-        if row:
-            return row[0]
-    return None
-
-
-def init_optimized_quests_db():
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS optimized_quests
-            (
-                master_mission_id bigint NOT NULL,
-                quest_id bigint NOT NULL,
-                target_id character varying NOT NULL,
-                target_count bigint NOT NULL,
-                region character varying(2),
-                "count" bigint NOT NULL,
-                is_or boolean NOT NULL DEFAULT false,
-                CONSTRAINT optimized_quests_pkey PRIMARY KEY (master_mission_id, quest_id, target_id)
-            )
-            """)
-
-
 class OptimizedQuest:
     master_mission_id: int
     quest_id: int
@@ -72,29 +31,6 @@ class OptimizedQuest:
         self.is_or = is_or
 
 
-def insert_optimized_quests(drops: list[OptimizedQuest], region: str = "JP"):
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        sql = f"DELETE FROM optimized_quests WHERE region='{region}';"
-        cur.execute(sql)
-        sql = "INSERT INTO optimized_quests(master_mission_id, quest_id, target_id, target_count, count, is_or, region) VALUES %s"
-        execute_values(
-            cur,
-            sql,
-            [(drop.master_mission_id, drop.quest_id, drop.target_id, drop.target_count, drop.count, drop.is_or, region) for drop in drops]
-        )
-        conn.commit()
-
-
-def get_optimized_quests(master_mission_id: int, region: str = "JP"):
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        cur.execute(f'SELECT master_mission_id, quest_id, target_id, target_count, count, is_or FROM optimized_quests WHERE master_mission_id = {master_mission_id} and region = \'{region}\' ORDER BY quest_id')
-        if cur.rowcount > 0:
-            return [OptimizedQuest(row[0], row[1], row[2], row[3], row[4], row[5]) for row in cur.fetchall()]
-        return None
-
-
 def insert_quest_enemies(quest_id: int, enemies: list[nice.QuestEnemy]):
     with psycopg2.connect(DATABASE_URL) as conn:
         cur = conn.cursor()
@@ -130,42 +66,3 @@ class QuestEnemiesTraits:
         self.enemy_id = enemy_id
         self.count = count
         self.traits = traits
-
-
-def get_quest_enemies(quest_id: int) -> list[QuestEnemiesTraits]:
-    with psycopg2.connect(DATABASE_URL) as conn:
-        cur = conn.cursor()
-        cur.execute(f"""
-        SELECT quest_id, quest_enemies.enemy_id, enemy_count, trait_id
-        FROM quest_enemies
-        INNER JOIN enemy_traits ON
-            quest_enemies.enemy_id = enemy_traits.enemy_id
-        WHERE quest_id = {quest_id}
-        ORDER BY quest_id, enemy_id, enemy_count
-        """)
-        if cur.rowcount <= 0:
-            return None
-            
-        quest_id = None
-        enemy_id = None
-        enemy_count = None
-        trait_id = None
-        quest_enemies_traits = None
-        result: list[QuestEnemiesTraits] = []
-        for row in cur.fetchall():
-            if quest_id != row[0] or enemy_id != row[1]:
-                if quest_enemies_traits is not None:
-                    result.append(quest_enemies_traits)
-                quest_id = row[0]
-                enemy_id = row[1]
-                enemy_count = row[2]
-                trait_id = row[3]
-                quest_enemies_traits = QuestEnemiesTraits(quest_id, enemy_id, enemy_count, [trait_id])
-                continue
-            trait_id = row[3]
-            quest_enemies_traits.traits.append(trait_id)
-
-        if quest_enemies_traits is not None:
-            result.append(quest_enemies_traits)
-            
-        return result
\ No newline at end of file
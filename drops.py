@@ -1,61 +1,313 @@
-import openpyxl
-from io import BytesIO
-import urllib.request
+import os
+import gzip
+import json
+import time
+import asyncio
+import zipfile
+import posixpath
+from xml.etree import ElementTree
 import pandas as pd
 
+import http_client
+import single_flight
+from catalog import get_catalog
 
-def load_workbook_from_url(url):
-    file = urllib.request.urlopen(url).read()
-    return openpyxl.load_workbook(filename=BytesIO(file), data_only=True)
-
-
-def get_drop_rates(item_name: str, region: str = "JP"):
-    if region == "JP":
-        url = "https://docs.google.com/spreadsheets/d/1_SlTjrVRTgHgfS7sRqx4CeJMqlz687HdSlYqiW-JvQA/edit#gid=843570146"
-    else:
-        url = "https://docs.google.com/spreadsheets/d/1_SlTjrVRTgHgfS7sRqx4CeJMqlz687HdSlYqiW-JvQA/edit#gid=1676231111"
-
-    url = url.replace('/edit#gid=', '/export?format=xlsx&gid=')
-    wb = load_workbook_from_url(url)
-    ws = wb.active
-    merged_cells = ws.merged_cells.ranges
-    found_cells = find_in_cells(item_name, merged_cells)
-    if len(found_cells) != 2: return None
-    data_rows = []
-    for row in ws.iter_rows(min_row=found_cells[0].row, max_row=found_cells[0].row + 4, min_col=found_cells[0].column + 1, max_col=found_cells[1].column - 1):
-        data_row = []
-        hyperlink_target = ""
-        for cell in row:
-            data_row.append(cell.value)
-            if cell.hyperlink: hyperlink_target = cell.hyperlink.target
-        data_row.append(hyperlink_target)
-        data_rows.append(data_row)
-        # data_rows.append([cell.value for cell in row])
-    df = pd.DataFrame(data_rows)
-    df = df.rename(columns={
-        0: 'No.',
-        1: 'Code',
-        2: 'Area',
-        3: 'Quest',
-        4: 'AP',
-        5: 'BP/AP',
-        6: 'AP/Drop',
-        7: 'AP Suffix',
-        8: 'Drop chance',
-        9: 'Drop chance Suffix',
-        10: 'Runs',
-        11: 'Hyperlink',
-    })
-
-    return df[df["Code"].notnull()]
-
-
-def find_in_cells(item_name: str, merged_cells):
-    found_cells = []
-    for range in merged_cells:
-        for cells in range.ws[range.coord]:
-            for cell in cells:
-                if cell.value and item_name.upper() in str(cell.value).upper():
-                    found_cells.append(cell)
-    
-    return sorted(found_cells, key=lambda cell: cell.column)
+DROPS_DIR = os.environ.get("DROPS_DIR", "drops")
+SHEET_URLS = {
+    "JP": "https://docs.google.com/spreadsheets/d/1_SlTjrVRTgHgfS7sRqx4CeJMqlz687HdSlYqiW-JvQA/export?format=xlsx&gid=843570146",
+    "NA": "https://docs.google.com/spreadsheets/d/1_SlTjrVRTgHgfS7sRqx4CeJMqlz687HdSlYqiW-JvQA/export?format=xlsx&gid=1676231111",
+}
+REFRESH_INTERVAL = 21600 # Seconds between downloads of the drop spreadsheet
+REFRESH_RETRY_INTERVAL = 900 # Seconds between refresh attempts (e.g. after a failed download)
+ROWS_PER_ITEM = 5
+COLUMNS = ['No.', 'Code', 'Area', 'Quest', 'AP', 'BP/AP', 'AP/Drop', 'AP Suffix', 'Drop chance', 'Drop chance Suffix', 'Runs', 'Hyperlink']
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+_tables: dict[str, "DropTable"] = {}
+_refresh_attempts: dict[str, float] = {}
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(str(name).upper().split())
+
+
+class DropTable:
+    """Drop rates of every item in the drop spreadsheet of a region.
+    Rows of all items are stored column by column, each item has a row range.
+    """
+    region: str
+    built_at: float
+    columns: dict[str, list]
+    spans: dict[str, tuple[int, int]]
+    spans_by_id: dict[int, tuple[int, int]]
+
+    def __init__(self, region: str, built_at: float):
+        self.region = region
+        self.built_at = built_at
+        self.columns = {column: [] for column in COLUMNS}
+        self.spans = {}
+        self.spans_by_id = {}
+
+    def add_item(self, item_name: str, rows: list[list]):
+        start = len(self.columns[COLUMNS[0]])
+        for row in rows:
+            values, hyperlink = row[:-1], row[-1]
+            row = (values + [None] * len(COLUMNS))[:len(COLUMNS) - 1] + [hyperlink]
+            for column, value in zip(COLUMNS, row):
+                self.columns[column].append(value)
+        self.spans[normalize_name(item_name)] = (start, len(self.columns[COLUMNS[0]]))
+
+    def index_ids(self, items_by_name: dict):
+        for item_name, item in items_by_name.items():
+            span = self.spans.get(normalize_name(item_name))
+            if span:
+                self.spans_by_id[item.id] = span
+
+    def get_span(self, item_name: str = "", item_id: int = None) -> tuple[int, int] | None:
+        if item_id in self.spans_by_id:
+            return self.spans_by_id[item_id]
+        if not item_name:
+            return None
+        name = normalize_name(item_name)
+        if name in self.spans:
+            return self.spans[name]
+        # Same as searching the sheet, only a single item containing the name counts
+        matches = [span for key, span in self.spans.items() if name in key]
+        return matches[0] if len(matches) == 1 else None
+
+    def find(self, item_name: str = "", item_id: int = None) -> pd.DataFrame | None:
+        """Gets the drop rates of an item, by ID or name.
+
+        Returns:
+            DataFrame: Quests with a code, None if the item is not in the sheet
+        """
+        span = self.get_span(item_name, item_id)
+        if span is None:
+            return None
+        start, stop = span
+        df = pd.DataFrame({column: values[start:stop] for column, values in self.columns.items()})
+        return df[df["Code"].notnull()]
+
+
+def get_sheet_region(region: str) -> str:
+    return "JP" if region == "JP" else "NA"
+
+
+def get_cell_position(ref: str) -> tuple[int, int]:
+    """Converts a cell reference (e.g. "AB12") to (row, column), starting from 1."""
+    column = 0
+    for i, char in enumerate(ref):
+        if char.isdigit():
+            return int(ref[i:]), column
+        column = column * 26 + ord(char.upper()) - ord("A") + 1
+    return 0, column
+
+
+def get_range_positions(ref: str) -> tuple[tuple[int, int], tuple[int, int]]:
+    start, _, end = ref.partition(":")
+    return get_cell_position(start), get_cell_position(end or start)
+
+
+def read_relationships(archive: zipfile.ZipFile, path: str) -> dict[str, str]:
+    folder, name = posixpath.split(path)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_path not in archive.namelist():
+        return {}
+    with archive.open(rels_path) as f:
+        return {rel.get("Id"): rel.get("Target") for rel in ElementTree.parse(f).getroot()}
+
+
+def get_active_sheet_path(archive: zipfile.ZipFile) -> str:
+    with archive.open("xl/workbook.xml") as f:
+        workbook = ElementTree.parse(f).getroot()
+    view = workbook.find(f"{{{MAIN_NS}}}bookViews/{{{MAIN_NS}}}workbookView")
+    active_tab = int(view.get("activeTab", 0)) if view is not None else 0
+    sheet = workbook.findall(f"{{{MAIN_NS}}}sheets/{{{MAIN_NS}}}sheet")[active_tab]
+    target = read_relationships(archive, "xl/workbook.xml")[sheet.get(f"{{{REL_NS}}}id")]
+    return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+
+
+def read_shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    strings = []
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return strings
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in ElementTree.iterparse(f):
+            if element.tag == f"{{{MAIN_NS}}}si":
+                strings.append("".join(text.text or "" for text in element.iter(f"{{{MAIN_NS}}}t")))
+                element.clear()
+    return strings
+
+
+def get_cell_value(cell, shared_strings: list[str]):
+    cell_type = cell.get("t", "n")
+    if cell_type == "inlineStr":
+        return "".join(text.text or "" for text in cell.iter(f"{{{MAIN_NS}}}t"))
+    value = cell.findtext(f"{{{MAIN_NS}}}v")
+    if value is None:
+        return None
+    if cell_type == "s":
+        return shared_strings[int(value)]
+    if cell_type in ("str", "e"):
+        return value
+    if cell_type == "b":
+        return value == "1"
+    number = float(value)
+    return int(number) if number.is_integer() and "." not in value and "E" not in value.upper() else number
+
+
+def parse_workbook(path: str, region: str) -> DropTable:
+    """Reads the drop spreadsheet without loading the whole workbook.
+    The first pass over the sheet only keeps merged cells and hyperlinks (stored after the cell data),
+    the second one streams the rows and keeps the cells of the item blocks.
+
+    Args:
+        path (str): XLSX file path
+        region (str): Sheet region
+
+    Returns:
+        DropTable: Drop table
+    """
+    with zipfile.ZipFile(path) as archive:
+        sheet_path = get_active_sheet_path(archive)
+        shared_strings = read_shared_strings(archive)
+        sheet_rels = read_relationships(archive, sheet_path)
+
+        # Pass 1: merged cells and hyperlinks
+        merged_tops: dict[int, list[int]] = {} # Row => columns of the top left cells of merged ranges
+        hyperlinks: dict[tuple[int, int], str] = {}
+        with archive.open(sheet_path) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag == f"{{{MAIN_NS}}}mergeCell":
+                    (row, column), _ = get_range_positions(element.get("ref"))
+                    merged_tops.setdefault(row, []).append(column)
+                elif element.tag == f"{{{MAIN_NS}}}hyperlink":
+                    target = sheet_rels.get(element.get(f"{{{REL_NS}}}id"))
+                    if target:
+                        (min_row, min_column), (max_row, max_column) = get_range_positions(element.get("ref"))
+                        for row in range(min_row, max_row + 1):
+                            for column in range(min_column, max_column + 1):
+                                hyperlinks[(row, column)] = target
+                elif element.tag == f"{{{MAIN_NS}}}row":
+                    element.clear()
+
+        # Rows that can hold item data and the columns between the first and last header of their block
+        windows: dict[int, list[tuple[int, int, int]]] = {}
+        for top, columns in merged_tops.items():
+            for row in range(top, top + ROWS_PER_ITEM):
+                windows.setdefault(row, []).append((top, min(columns), max(columns)))
+
+        # Pass 2: header values and item block cells
+        headers: dict[str, list[tuple[int, int]]] = {}
+        cells: dict[tuple[int, int], object] = {}
+        with archive.open(sheet_path) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag != f"{{{MAIN_NS}}}row":
+                    continue
+                row = int(element.get("r"))
+                row_windows = windows.get(row)
+                if row_windows:
+                    for cell in element.iter(f"{{{MAIN_NS}}}c"):
+                        _, column = get_cell_position(cell.get("r"))
+                        if not any(min_column <= column <= max_column for _, min_column, max_column in row_windows):
+                            continue
+                        value = get_cell_value(cell, shared_strings)
+                        if row in merged_tops and column in merged_tops[row]:
+                            if isinstance(value, str) and value.strip():
+                                headers.setdefault(value, []).append((row, column))
+                        elif value is not None:
+                            cells[(row, column)] = value
+                element.clear()
+
+    # Each item block is between two merged cells with the item name
+    table = DropTable(region, time.time())
+    for item_name, positions in headers.items():
+        if len(positions) != 2: continue
+        (row, first_column), (_, last_column) = sorted(positions, key=lambda position: position[1])
+        data_rows = []
+        for data_row_index in range(row, row + ROWS_PER_ITEM):
+            data_row = []
+            hyperlink_target = ""
+            for column in range(first_column + 1, last_column):
+                data_row.append(cells.get((data_row_index, column)))
+                if (data_row_index, column) in hyperlinks: hyperlink_target = hyperlinks[(data_row_index, column)]
+            data_row.append(hyperlink_target)
+            data_rows.append(data_row)
+        table.add_item(item_name, data_rows)
+    return table
+
+
+def save_table(table: DropTable, path: str):
+    # Written to a temp file first so a crash never leaves a truncated table
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        json.dump({"region": table.region, "built_at": table.built_at, "columns": table.columns, "spans": table.spans}, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def load_table(path: str) -> DropTable | None:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, OSError, json.JSONDecodeError):
+        return None
+    table = DropTable(data["region"], data["built_at"])
+    table.columns = data["columns"]
+    table.spans = {name: tuple(span) for name, span in data["spans"].items()}
+    return table
+
+
+def get_table_path(region: str) -> str:
+    return os.path.join(DROPS_DIR, f"{region}.json.gz")
+
+
+async def create_drop_table(region: str) -> DropTable:
+    os.makedirs(DROPS_DIR, exist_ok=True)
+    path = os.path.join(DROPS_DIR, f"{region}.xlsx")
+    await http_client.download(SHEET_URLS[region], path)
+    table = await asyncio.to_thread(parse_workbook, path, region)
+    await asyncio.to_thread(save_table, table, get_table_path(region))
+    os.remove(path)
+    return await set_drop_table(table)
+
+
+async def load_drop_table(region: str) -> DropTable:
+    """Loads the drop table saved by the last download, downloading it if there is none."""
+    table = await asyncio.to_thread(load_table, get_table_path(region))
+    if table is None:
+        return await create_drop_table(region)
+    return await set_drop_table(table)
+
+
+async def set_drop_table(table: DropTable) -> DropTable:
+    table.index_ids((await get_catalog("JP")).items_by_name)
+    _tables[table.region] = table
+    return table
+
+
+async def get_drop_table(region: str = "JP") -> DropTable:
+    """Gets the drop table of a region, parsed once per download and saved for restarts.
+    After `REFRESH_INTERVAL` the previous table is still returned while a new one is built in the background,
+    at most once every `REFRESH_RETRY_INTERVAL` so that a failing download is not retried on every call.
+
+    Args:
+        region (str): Region (Default: JP)
+
+    Returns:
+        DropTable: Drop table
+    """
+    region = get_sheet_region(region)
+    table = _tables.get(region)
+    if table is None:
+        table = await single_flight.do(f"drops:{region}", load_drop_table, region)
+    now = time.time()
+    if now - table.built_at >= REFRESH_INTERVAL and now - _refresh_attempts.get(region, 0) >= REFRESH_RETRY_INTERVAL:
+        _refresh_attempts[region] = now
+        single_flight.do_in_background(f"drops:{region}:refresh", create_drop_table, region)
+    return table
+
+
+async def get_drop_rates(item_name: str, region: str = "JP", item_id: int = None) -> pd.DataFrame | None:
+    table = await get_drop_table(region)
+    return table.find(item_name, item_id)
@@ -1,7 +1,7 @@
+import os
+import numpy as np
 from scipy.stats import binom
 
-import cvxpy
-
 def get_percentage_text(value: int) -> str:
     return f'{remove_zeros_decimal("{:.2f}".format(value * 100))}%'
 
@@ -16,62 +16,259 @@ QUARTZ_PACKS = [
     (3000, 41),
     (1600, 21),
     (480, 5),
-]
+] # (Price in yen, quartz)
+MAX_PACK_QUARTZ = int(os.environ.get("MAX_PACK_QUARTZ", "10000")) # Quartz covered by the purchase tables
+
+SPARK_ROLLS = 330 # A rate-up servant is guaranteed if none was summoned within this many rolls (once per banner)
+SIMULATION_RUNS = 500000 # Fixed so that a seed always gives the same result, under a second with 6 servants
+SIMULATION_BATCH = 100000
+SIMULATION_QUANTILES = [0.5, 0.9, 0.99]
+
+_pack_table: "PackTable" = None
+
+
+class PackTable:
+    """Cheapest quartz pack purchases for every amount of quartz up to a ceiling,
+    computed once by dynamic programming (unbounded knapsack, covering at least the amount).
+    """
+    packs: list[tuple[int, int]]
+    ceiling: int
+
+    def __init__(self, packs: list[tuple[int, int]], ceiling: int = MAX_PACK_QUARTZ):
+        self.packs = packs
+        self.ceiling = ceiling
+        # costs[q]: cheapest price for at least q quartz, choices[q]: pack bought first for it
+        self.costs = np.zeros(ceiling + 1, dtype=np.int64)
+        self.choices = np.full(ceiling + 1, -1, dtype=np.int64)
+        for q in range(1, ceiling + 1):
+            best_cost, best_choice = None, -1
+            for idx, (price, quartz) in enumerate(packs):
+                cost = price + self.costs[max(0, q - quartz)]
+                if best_cost is None or cost < best_cost:
+                    best_cost, best_choice = cost, idx
+            self.costs[q] = best_cost
+            self.choices[q] = best_choice
+        # Pack with the lowest price per quartz, used above the ceiling
+        self.best_value = min(range(len(packs)), key=lambda idx: packs[idx][0] / packs[idx][1])
+
+    def get_purchase(self, number_of_quartz: int) -> list[int]:
+        """Gets how many of each pack to buy for at least `number_of_quartz` quartz.
+
+        Returns:
+            list: Number of packs, in the order of `packs`
+        """
+        counts = [0] * len(self.packs)
+        q = max(0, number_of_quartz)
+        if q > self.ceiling:
+            # Fill the amount above the ceiling with the best value pack
+            quartz = self.packs[self.best_value][1]
+            extra = -(-(q - self.ceiling) // quartz)
+            counts[self.best_value] += extra
+            q = max(0, q - extra * quartz)
+        while q > 0:
+            idx = self.choices[q]
+            counts[idx] += 1
+            q = max(0, q - self.packs[idx][1])
+        return counts
+
+
+def get_pack_table() -> PackTable:
+    global _pack_table
+    if _pack_table is None:
+        _pack_table = PackTable(QUARTZ_PACKS)
+    return _pack_table
+
+
+MAX_NP_LEVEL = 5
+MAX_ROLLS = 1 << 20 # Upper bound of inverse queries
+
+
+def get_number_of_rolls(number_of_quartz: int, number_of_tickets: int) -> int:
+    """Rolls for the quartz and tickets, 11 rolls for every 30 quartz or 10 tickets."""
+    return (
+        number_of_quartz // 30 * 11 + number_of_quartz % 30 // 3 +
+        number_of_tickets // 10 * 11 + number_of_tickets % 10
+    )
+
+
+def get_quartz_for_rolls(rolls: int) -> int:
+    return rolls // 11 * 30 + min(rolls % 11 * 3, 30)
+
+
+def get_tickets_for_rolls(rolls: int) -> int:
+    return rolls // 11 * 10 + min(rolls % 11, 10)
+
+
+def get_np_distribution(n: int, p: float) -> np.ndarray:
+    """Gets the chance of NP0 (exactly) and NP1+ to NP5+ (at least) in n rolls.
+
+    Args:
+        n (int): Number of rolls
+        p (float): Servant probability
+
+    Returns:
+        ndarray: [P(NP0), P(NP1+), ..., P(NP5+)], up to NPn+ if n < 5
+    """
+    levels = np.arange(min(n, MAX_NP_LEVEL) + 1)
+    # P(X >= k) = sf(k - 1), and sf(-1) = 1 - P(X = 0) is replaced by the pmf for NP0
+    dist = binom.sf(levels - 1, n, p)
+    dist[0] = binom.pmf(0, n, p)
+    return dist
+
 
+def get_rolls_for_chance(chance: float, np_level: int = 1, p: float = 0.008) -> int:
+    """Gets the smallest number of rolls that gives at least `chance` of NP`np_level`+.
 
-def roll(number_of_quartz: int, number_of_tickets: int, p: float = 0.008) -> str:
-    n = 0
-    for i in range(int(number_of_quartz / 30)):
-        n += 11
-    remaining_quartz = number_of_quartz % 30
-    n += int(remaining_quartz / 3)
+    Args:
+        chance (float): Target probability (0 - 1)
+        np_level (int, optional): NP level. Defaults to 1.
+        p (float, optional): Servant probability. Defaults to 0.008.
 
-    for i in range(int(number_of_tickets / 10)):
-        n += 11
-    n += number_of_tickets % 10
+    Returns:
+        int: Number of rolls, None if it takes more than `MAX_ROLLS`
+    """
+    upper = max(np_level, 1)
+    while binom.sf(np_level - 1, upper, p) < chance:
+        if upper >= MAX_ROLLS:
+            return None
+        upper *= 2
+    rolls = np.arange(upper + 1)
+    return int(np.searchsorted(binom.sf(np_level - 1, rolls, p), chance))
+
+
+def roll(number_of_quartz: int, number_of_tickets: int, p: float = 0.008, target_chance: float = None) -> str:
+    n = get_number_of_rolls(number_of_quartz, number_of_tickets)
     result_text = []
     if number_of_quartz > 0: result_text.append(f'**Number of quartz:** {number_of_quartz}')
     if number_of_tickets > 0: result_text.append(f'**Number of tickets:** {number_of_tickets}')
     result_text.append(f'**Rolls:** {n}')
     result_text.append(f'**Probability:** {get_percentage_text(p)}\n')
-    r_values = list(range(n + 1))
-    dist = [binom.pmf(r, n, p) for r in r_values ]
-    for i in range(n + 1):
-        if i == 0:
-            text = f'**NP{str(r_values[i])}:** {get_percentage_text(dist[i])}'
-            result_text.append(text)
+    for np_level, chance in enumerate(get_np_distribution(n, p)):
+        if np_level == 0:
+            result_text.append(f'**NP0:** {get_percentage_text(chance)}')
+        else:
+            result_text.append(f'**NP{np_level}+:** {get_percentage_text(chance)}')
+
+    if target_chance and 0 < target_chance < 1:
+        result_text.append(f"\n**Needed for a {get_percentage_text(target_chance)} chance**:")
+        for np_level in range(1, MAX_NP_LEVEL + 1):
+            rolls = get_rolls_for_chance(target_chance, np_level, p)
+            if rolls is None: continue
+            result_text.append(f'**NP{np_level}+:** {rolls} rolls ({get_quartz_for_rolls(rolls)} quartz or {get_tickets_for_rolls(rolls)} tickets)')
+
+    pack_table = get_pack_table()
+    result_text.append("\n**Amount of money needed**:")
+    total_money = 0
+    total_quartz = 0
+    for (price, quartz), count in zip(pack_table.packs, pack_table.get_purchase(number_of_quartz)):
+        if count == 0:
             continue
-        if i > 5: continue
-        sum = 0
-        for j in range(i, n + 1):
-            sum += dist[j]
-        text = f'**NP{str(r_values[i])}+:** {get_percentage_text(sum)}'
-        result_text.append(text)
-
-    quartzes = [pack[1] for pack in QUARTZ_PACKS]
-    yen = [pack[0] for pack in QUARTZ_PACKS]
-    selection = cvxpy.Variable(len(quartzes), integer=True)
-
-    constraints = [
-        selection >= 0,
-        selection @ quartzes >= number_of_quartz
-    ]
-    
-    total_yen = selection @ yen
-
-    prob = cvxpy.Problem(cvxpy.Minimize(total_yen), constraints)
-    prob.solve(solver=cvxpy.GLPK_MI)
-
-    if prob.status == "optimal":
-        result_text.append("\n**Amount of money needed**:")
-        total_money = 0
-        total_quartz = 0
-        for idx, value in enumerate(selection.value):
-            if value == 0:
-                continue
-            result_text.append(f'{QUARTZ_PACKS[idx][0]} ({int(QUARTZ_PACKS[idx][1])}) x {int(value)} = {int(QUARTZ_PACKS[idx][1] * value)} quartz')
-            total_money += QUARTZ_PACKS[idx][0] * value
-            total_quartz += QUARTZ_PACKS[idx][1] * value
-        result_text.append(f"**Total**: {int(total_quartz)} quartz ({int(total_money)} yen)")
+        result_text.append(f'{price} ({quartz}) x {count} = {quartz * count} quartz')
+        total_money += price * count
+        total_quartz += quartz * count
+    result_text.append(f"**Total**: {total_quartz} quartz ({total_money} yen)")
+
+    return "\n".join(result_text)
+
+
+class SimulationResult:
+    """Outcome of simulated banners with one or more rate-up servants."""
+    runs: int
+    rolls: int
+    copies: np.ndarray # (runs, servants) copies of each rate-up servant
+    rolls_for_all: np.ndarray # Rolls until every rate-up servant was summoned, per run
+
+    def __init__(self, rolls: int, copies: np.ndarray, rolls_for_all: np.ndarray):
+        self.runs = len(copies)
+        self.rolls = rolls
+        self.copies = copies
+        self.rolls_for_all = rolls_for_all
+
+    def get_np_distribution(self, servant: int = 0) -> np.ndarray:
+        """Gets the chance of NP0 (exactly) and NP1+ to NP5+ (at least) of a rate-up servant."""
+        counts = np.bincount(np.minimum(self.copies[:, servant], MAX_NP_LEVEL), minlength=MAX_NP_LEVEL + 1) / self.runs
+        dist = counts[::-1].cumsum()[::-1]
+        dist[0] = counts[0]
+        return dist
+
+    def get_all_chance(self) -> float:
+        """Gets the chance of summoning every rate-up servant at least once."""
+        return float(np.mean(np.all(self.copies > 0, axis=1)))
+
+    def get_quantiles(self, quantiles: list[float] = SIMULATION_QUANTILES) -> np.ndarray:
+        """Gets the number of rolls that is enough to summon every rate-up servant in the given share of runs."""
+        return np.quantile(self.rolls_for_all, quantiles, method="higher")
 
+
+def simulate(
+    number_of_quartz: int,
+    number_of_tickets: int,
+    rates: list[float],
+    runs: int = SIMULATION_RUNS,
+    seed: int = 0,
+    tickets_count_for_spark: bool = True,
+) -> SimulationResult:
+    """Simulates banners with one or more rate-up servants, in batches of NumPy draws.
+    Copies are drawn per run as multinomial counts over the rate-up servants and everything else,
+    split at the spark so that the guaranteed servant (the first one) is added only to runs
+    that got none before it. The spark comes after `SPARK_ROLLS` rolls, and when tickets do not
+    count towards it, the ticket rolls are assumed to come first and push it back by as many rolls.
+
+    Args:
+        number_of_quartz (int): Number of quartz
+        number_of_tickets (int): Number of tickets
+        rates (list[float]): Probability of each rate-up servant
+        runs (int, optional): Number of simulated banners. Defaults to `SIMULATION_RUNS`.
+        seed (int, optional): Random seed, the same seed gives the same result. Defaults to 0.
+        tickets_count_for_spark (bool, optional): Whether ticket rolls count towards the spark. Defaults to True.
+
+    Returns:
+        SimulationResult: Simulated copies and rolls
+    """
+    rng = np.random.default_rng(seed)
+    n = get_number_of_rolls(number_of_quartz, number_of_tickets)
+    spark_at = SPARK_ROLLS if tickets_count_for_spark else SPARK_ROLLS + get_number_of_rolls(0, number_of_tickets)
+    before_spark = min(n, spark_at)
+    pvals = list(rates) + [max(0.0, 1 - sum(rates))]
+    rates = np.array(rates)
+
+    copies = []
+    rolls_for_all = []
+    done = 0
+    while done < runs:
+        size = min(SIMULATION_BATCH, runs - done)
+        batch = rng.multinomial(before_spark, pvals, size=size)[:, :-1]
+        if before_spark == spark_at:
+            batch[:, 0] += ~np.any(batch > 0, axis=1)
+        if n > before_spark:
+            batch += rng.multinomial(n - before_spark, pvals, size=size)[:, :-1]
+        copies.append(batch)
+
+        # Rolls until each servant is first summoned when rolling past the budget,
+        # the spark gives the first one at the latest
+        first_rolls = rng.geometric(rates, size=(size, len(rates)))
+        missed = first_rolls.min(axis=1) > spark_at
+        first_rolls[missed, 0] = spark_at
+        rolls_for_all.append(first_rolls.max(axis=1))
+
+        done += size
+    return SimulationResult(n, np.concatenate(copies), np.concatenate(rolls_for_all))
+
+
+def simulate_text(number_of_quartz: int, number_of_tickets: int, rates: list[float], seed: int = 0, tickets_count_for_spark: bool = True) -> str:
+    result = simulate(number_of_quartz, number_of_tickets, rates, seed=seed, tickets_count_for_spark=tickets_count_for_spark)
+    result_text = []
+    if number_of_quartz > 0: result_text.append(f'**Number of quartz:** {number_of_quartz}')
+    if number_of_tickets > 0: result_text.append(f'**Number of tickets:** {number_of_tickets}')
+    result_text.append(f'**Rolls:** {result.rolls}')
+    result_text.append(f'**Simulated banners:** {result.runs:,} (seed {seed})')
+    for servant, rate in enumerate(rates):
+        result_text.append(f'\n**Servant {servant + 1}** ({get_percentage_text(rate)}{", spark pick" if servant == 0 else ""}):')
+        for np_level, chance in enumerate(result.get_np_distribution(servant)):
+            result_text.append(f'**NP{np_level}{"" if np_level == 0 else "+"}:** {get_percentage_text(chance)}')
+    if len(rates) > 1:
+        result_text.append(f'\n**All servants:** {get_percentage_text(result.get_all_chance())}')
+    result_text.append("\n**Rolls needed for all servants**:")
+    for quantile, rolls in zip(SIMULATION_QUANTILES, result.get_quantiles()):
+        result_text.append(f'{get_percentage_text(quantile)} chance: {int(rolls)} rolls ({get_quartz_for_rolls(int(rolls))} quartz)')
     return "\n".join(result_text)
@@ -0,0 +1,126 @@
+import json
+import os
+import aiohttp
+
+import single_flight
+from cache import get_cache, get_ttl
+
+MAX_CONNECTIONS = 100
+MAX_CONNECTIONS_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 60 # Seconds
+REQUEST_TIMEOUT = 120 # Seconds
+
+_session: aiohttp.ClientSession = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Gets the shared client session, creating it on first use inside the running event loop.
+    Connections are pooled and kept alive, at most `MAX_CONNECTIONS_PER_HOST` at a time per host.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+    return _session
+
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def get_validators(response: aiohttp.ClientResponse) -> dict[str, str]:
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+
+def get_conditional_headers(validators: dict) -> dict[str, str]:
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+async def fetch_json(url: str, expire_after: int = None):
+    key = single_flight.normalize_url(url)
+    cache = get_cache()
+    value = await cache.get_json(key)
+    if value is not None:
+        return value
+
+    ttl = get_ttl(url) if expire_after is None else expire_after
+    stale = await cache.get_stale(key) if ttl > 0 else None
+    headers = get_conditional_headers(stale[2]) if stale else {}
+    async with get_session().get(url, headers=headers) as response:
+        if response.status == 304 and stale:
+            # Unchanged, keep the parsed value (only parse if it was evicted from memory)
+            value, body, validators, size = stale
+            if value is None:
+                value = json.loads(body)
+            await cache.touch(key, value, size, ttl, validators)
+            return value
+        body = await response.text()
+        value = json.loads(body)
+        if response.status == 200:
+            await cache.set_json(key, body, value, ttl, get_validators(response))
+        return value
+
+
+async def get_json(url: str, expire_after: int = None):
+    """Gets and parses a JSON response through the memory and disk caches.
+    Expired responses are revalidated with a conditional request (ETag / Last-Modified).
+    Concurrent requests for the same URL share one fetch.
+
+    Args:
+        url (str): URL
+        expire_after (int, optional): Cache expiration in seconds. Defaults to the TTL policy of the URL, 0 disables caching.
+
+    Returns:
+        Parsed JSON response, shared with the cache and other callers (do not modify it)
+    """
+    return await single_flight.do(single_flight.normalize_url(url), fetch_json, url, expire_after)
+
+
+def get_cached_validators(url: str) -> dict[str, str] | None:
+    """Gets the ETag / Last-Modified of the response cached in memory for a URL (e.g. to key data derived from it).
+
+    Returns:
+        dict: Validators, None if the response is not in memory or has none
+    """
+    entry = get_cache().memory.peek(single_flight.normalize_url(url))
+    if entry is None or not any(entry[3].values()):
+        return None
+    return entry[3]
+
+
+async def download(url: str, path: str, validators: dict = None) -> dict[str, str] | None:
+    """Streams a URL into a file. The file is replaced only once the download completes.
+
+    Args:
+        url (str): URL
+        path (str): Destination file path
+        validators (dict, optional): ETag / Last-Modified of a previous download, sent as a conditional request
+
+    Returns:
+        dict: ETag / Last-Modified of the downloaded file, None if it was not modified (nothing is written)
+    """
+    async with get_session().get(url, headers=get_conditional_headers(validators)) as response:
+        if response.status == 304:
+            return None
+        response.raise_for_status()
+        with open(path + ".tmp", "wb") as f:
+            async for chunk in response.content.iter_chunked(1 << 20):
+                f.write(chunk)
+        result = get_validators(response)
+    os.replace(path + ".tmp", path)
+    return result
@@ -1,32 +1,42 @@
 import asyncio
 import configparser
-import json
 import interactions
-import requests_cache
+import logging
+import time
 import os
-import db
+import autocomplete
+import async_db
+import http_client
+import single_flight
+import snapshot
+from cache import MemoryCache
+from catalog import get_catalog, refresh_catalogs
 
 from interactions.ext.paginator import Page, Paginator
 from interactions.ext.tasks import IntervalTrigger, create_task
 from interactions.ext.wait_for import setup, wait_for_component
 from interactions.ext.persistence import PersistentCustomID
-from gacha_calc import roll
+from gacha_calc import roll, simulate_text
 from quests import TraitSearchQuery
 
-from text_builders import get_skill_description, title_case, get_enums, get_traits, func_desc_dict, buff_desc_dict, target_desc_dict, get_servant_by_id, remove_zeros_decimal
-import skill_lookup
-from skill_lookup import get_skills_with_type, get_skills_with_buff, get_skills_with_trait, get_np_chargers
+from text_builders import get_skill_description, prefetch_skill_dependencies, title_case, get_enums, get_traits, func_desc_dict, buff_desc_dict, target_desc_dict, get_servant_by_id, get_servant_url, remove_zeros_decimal
+import search_index
+from skill_lookup import get_np_chargers, refresh_np_charge_tables
 import missions as ms
-import fgo_api_types.nice as nice
 import fgo_api_types.enums as enums
 
 
 # commands = ["/servant", "/missions", "/drops", "/np-chargers", "/search skill", "/search np", "/search skill-or-np", "/support", "/gacha"]
 # currentCmdIdx = 0
 
-session = requests_cache.CachedSession(expire_after=600)
 bot: interactions.Client = None
 
+SEARCH_DEADLINE = 20 # Seconds a search may take before returning partial results
+RENDER_CONCURRENCY = 16 # Search result descriptions rendered at the same time
+PAGE_CACHE_BUDGET = int(os.environ.get("PAGE_CACHE_BUDGET_MB", "16")) * 1024 * 1024
+PAGE_CACHE_TTL = 3600 # Seconds, bounds how long pages keep skill data fetched while rendering
+servant_page_cache = MemoryCache(PAGE_CACHE_BUDGET)
+
 
 def new_presence() -> interactions.ClientPresence:
     return interactions.ClientPresence(
@@ -40,7 +50,7 @@ def new_presence() -> interactions.ClientPresence:
     )
 
 
-def get_servant(name: str, cv_id: str, class_name: str, region: str = "JP"):
+async def get_servant(name: str, cv_id: str, class_name: str, region: str = "JP"):
     """Gets the servant info based on the search query.
 
     Args:
@@ -61,15 +71,45 @@ def get_servant(name: str, cv_id: str, class_name: str, region: str = "JP"):
         cvQuery = f"&cv={get_cv_name(cv_id, region)}"
     if class_name:
         clsNameQuery= f"&className={class_name}"
-    response = session.get(
+    servants = await http_client.get_json(
         f"https://api.atlasacademy.io/basic/{region}/svt/search?{nameQuery}{cvQuery}{clsNameQuery}&type=normal&type=heroine&lang=en")
-    servants = json.loads(response.text)
     if not isinstance(servants, list):
         servants = []
     return servants
 
 
-def create_servant_pages(servant, region):
+async def get_servant_pages(id: int | str, region: str = "JP"):
+    """Gets the servant info pages, rendered once per version of the servant data.
+    Pages are keyed by the ETag / Last-Modified of the servant response they were rendered from
+    (the data version if it has none), so a changed response is rendered again.
+
+    Args:
+        id (int | str): Servant ID
+        region (str): Region (Default: JP)
+
+    Returns:
+        list: Pages
+    """
+    servant = await get_servant_by_id(id, region)
+    validators = http_client.get_cached_validators(get_servant_url(id, region))
+    if validators:
+        key = f"{region}:{id}:{validators.get('etag') or validators.get('last_modified')}"
+    else:
+        key = f"{region}:{id}:{await snapshot.get_version(region)}"
+    pages = servant_page_cache.get(key)
+    if pages is None:
+        pages = await single_flight.do(f"pages:{key}", render_servant_pages, key, servant, region)
+    return pages
+
+
+async def render_servant_pages(key: str, servant: dict, region: str):
+    pages = await create_servant_pages(servant, region)
+    size = sum(len(str(page.embeds._json)) for page in pages)
+    servant_page_cache.set(key, pages, size, time.time() + PAGE_CACHE_TTL)
+    return pages
+
+
+async def create_servant_pages(servant, region):
     pages = []
 
     servant_desc = f'[{servant.get("name")} ({title_case(servant.get("className"))})](https://apps.atlasacademy.io/db/JP/servant/{servant.get("id")})'
@@ -129,6 +169,8 @@ def create_servant_pages(servant, region):
     embed.set_footer("Data via Atlas Academy")
     pages.append(Page(f"Basic Info", embed))
 
+    await prefetch_skill_dependencies(servant.get('skills') + servant.get('noblePhantasms'), region)
+
     # Skills
     if len(servant.get('skills')) > 0:
         skill_descriptions = []
@@ -145,7 +187,7 @@ def create_servant_pages(servant, region):
         for skill in sorted(servant.get('skills'), key=lambda s: (s.get('num'), s.get('id'))):
             skill_descriptions.append("")
             skill_descriptions.append(f"**Skill {skill.get('num')}: [{skill.get('name')}](https://apps.atlasacademy.io/db/JP/skill/{skill.get('id')})**")
-            skill_descriptions.append(get_skill_description(session, skill, False, region))
+            skill_descriptions.append(await get_skill_description(skill, False, region))
 
         embed.description = "\n".join(skill_descriptions)
         embed.set_footer("Data via Atlas Academy")
@@ -164,7 +206,7 @@ def create_servant_pages(servant, region):
         np_descriptions.append(servant_desc)
         for i, noblePhantasm in enumerate(servant.get("noblePhantasms")):
             np_descriptions.append("")
-            np_description = get_skill_description(session, noblePhantasm, False, region)
+            np_description = await get_skill_description(noblePhantasm, False, region)
             np_url = f'https://apps.atlasacademy.io/db/JP/noble-phantasm/{noblePhantasm.get("id")}'
             np_descriptions.append(f"**Noble Phantasm {i + 1}:**")
             np_descriptions.append(f"[{noblePhantasm.get('name')} {noblePhantasm.get('rank')} ({noblePhantasm.get('card').capitalize()})]({np_url})")
@@ -226,15 +268,7 @@ def create_servant_pages(servant, region):
     return pages
 
 
-def get_skill_details(id: str = "", flag: str = "skill", region: str = "JP"):
-    if not id:
-        return None
-    url = f"https://api.atlasacademy.io/nice/{region}/{flag}/{id}?lang=en"
-    response = session.get(url)
-    return json.loads(response.text)
-
-
-def get_skills(
+async def get_skills(
     type: str = "",
     type2: str = "",
     flag: str = "skill",
@@ -259,18 +293,20 @@ def get_skills(
     Returns:
         Pages of embeds containing the skills data.
     """
-    skill_lookup.init_session(session)
-    found_list_1 = get_skills_with_type(type, flag, target, region) if type else None
-    found_list_2 = get_skills_with_type(type2, flag, target, region) if type2 else None
-    
-    found_buff_list1 = get_skills_with_buff(buffType1, flag, target, "", region)
-    found_buff_list2 = get_skills_with_buff(buffType2, flag, target, "", region)
-
-    found_trait_list = get_skills_with_trait(trait, flag, target, region)
-
-    matched_skills_list = common_elements(
-        found_list_1, found_list_2, found_buff_list1, found_buff_list2, found_trait_list
-    )
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SEARCH_DEADLINE
+    try:
+        # Shielded so that the index keeps building for the next command
+        index = await asyncio.wait_for(asyncio.shield(search_index.get_index(region)), SEARCH_DEADLINE)
+    except Exception as e:
+        if not isinstance(e, asyncio.TimeoutError):
+            # The next command retries the build
+            logging.getLogger(__name__).error("Skill index build failed", exc_info=e)
+        embed = create_embed(type, type2, flag, target, buffType1, buffType2, trait, region)
+        embed.description = "Search data is still loading, please try again in a moment."
+        return [Page("Search result", embeds=embed)]
+    filters = [("type", type), ("type", type2), ("buff", buffType1), ("buff", buffType2), ("trait", trait)]
+    matched_skills_list = index.find_all(flag, [(kind, value) for kind, value in filters if value], target)
 
     embeds = []
     embed = create_embed(type, type2, flag, target,
@@ -279,21 +315,43 @@ def get_skills(
     pageCount = 0
     totalCount = 0
     embed_desc = []
-    for skill in matched_skills_list:
-        if not skill.get('name'):
-            continue
-        skill_details = get_skill_details(skill.get('id'), flag)
-        if (skill_details.get('type') == "passive"):
+    matched_skills_list = [
+        skill_id for skill_id in matched_skills_list
+        if index.get_details(flag, skill_id).get('name') and index.get_details(flag, skill_id).get('type') != "passive"
+    ]
+    # Fetch what the descriptions depend on once for all the results, then render them concurrently.
+    # Descriptions not ready by the deadline are left out.
+    try:
+        await asyncio.wait_for(
+            prefetch_skill_dependencies([index.get_details(flag, skill_id) for skill_id in matched_skills_list], region),
+            max(0, deadline - loop.time())
+        )
+    except asyncio.TimeoutError:
+        pass # Whatever is still missing is fetched by the descriptions until the deadline
+    semaphore = asyncio.Semaphore(RENDER_CONCURRENCY)
+
+    async def render_description(skill_details):
+        async with semaphore:
+            return await get_skill_description(skill_details, False, region)
+
+    tasks = {
+        skill_id: asyncio.ensure_future(render_description(index.get_details(flag, skill_id)))
+        for skill_id in matched_skills_list
+    }
+    pending = set()
+    if len(tasks) > 0:
+        _, pending = await asyncio.wait(tasks.values(), timeout=max(0, deadline - loop.time()))
+    for task in pending:
+        task.cancel()
+    truncated = len(pending) > 0
+    for skill_id in matched_skills_list:
+        if tasks[skill_id] in pending:
             continue
-        servants = skill.get('reverse').get('basic').get('servant')
+        skill_details = index.get_details(flag, skill_id)
+        skill_description = tasks[skill_id].result()
+        servants = index.get_servants(flag, skill_id)
         servantList = []
         for servant in servants:
-            if (
-                not servant.get('name') or
-                (servant.get('type') != "normal" and servant.get('type')
-                 != "heroine")  # Mash has her own category lmao
-            ):
-                continue
             servant_id = f"{servant.get('name')} ({title_case(servant.get('className'))})"
             if servant_id not in servantList:
                 totalCount += 1
@@ -308,19 +366,21 @@ def get_skills(
                 skillName = skill_details.get('name')
                 embed_desc.append("")
                 embed_desc.append(f'**{totalCount}: [{servant.get("name")} ({title_case(servant.get("className"))})](https://apps.atlasacademy.io/db/JP/servant/{servant.get("id")})**')
-                embed_desc.append(f"**{'Skill' if flag == 'skill' else 'NP'} {skill_details.get('num')}: [{skillName}](https://apps.atlasacademy.io/db/{region}/{'skill' if flag == 'skill' else 'noble-phantasm'}/{skill.get('id')})**")
-                embed_desc.append(get_skill_description(session, skill_details, False, region))
+                embed_desc.append(f"**{'Skill' if flag == 'skill' else 'NP'} {skill_details.get('num')}: [{skillName}](https://apps.atlasacademy.io/db/{region}/{'skill' if flag == 'skill' else 'noble-phantasm'}/{skill_id})**")
+                embed_desc.append(skill_description)
                 
                 pageCount += 1
 
     pages = []
     if (totalCount == 0):
-        embed.description = "No result."
+        embed.description = "No result." if not truncated else "No result within the time limit, please try again."
         pages.append(Page("Search result", embeds=embed))
         return pages
     else:
         embed.set_footer("Data via Atlas Academy")
     embed.description = "\n".join(embed_desc)
+    if truncated:
+        embed.description += "\n\n*Results truncated (time limit reached).*"
     embeds.append(embed)
     cnt = 0
     for resEmbed in embeds:
@@ -370,33 +430,12 @@ def create_embed(type: str = "", type2: str = "", flag: str = "skill", target: s
     return embed
 
 
-def common_elements(*lists):
-    """Finds common elements in a list of lists
-    """
-    common_list = []
-    for list in lists:
-        if list == None:
-            continue
-        if len(list) == 0:
-            return []
-        if len(common_list) == 0 and len(list) > 0:
-            common_list.extend(list)
-            continue
-        common_list = [element for element in common_list if element in list]
-    res = []
-    [res.append(x) for x in common_list if x not in res]
-    return res
-
-
-def check_region(guild_id: int, region: str):
+async def check_region(guild_id: int, region: str):
     if not region:
-        db_region = db.get_region(guild_id)
-        if db_region:
-            region = db_region
-        else:
+        region = await async_db.get_region(guild_id)
+        if not region:
             region = "JP"
-            db.set_region(guild_id, region)
-
+            await async_db.set_region(guild_id, region)
     return region.upper()
 
 
@@ -413,7 +452,7 @@ async def find_logic(
         await ctx.send(content="Invalid input.", ephemeral=True)
         return []
     
-    region = await asyncio.to_thread(check_region, ctx.guild_id, region)
+    region = await check_region(ctx.guild_id, region)
 
     buff = ""
     buff2 = ""
@@ -424,7 +463,7 @@ async def find_logic(
         buff2 = type2
         type2 = ""
 
-    pages = await asyncio.to_thread(get_skills, type, type2, flag, target, buff, buff2, trait, region)
+    pages = await get_skills(type, type2, flag, target, buff, buff2, trait, region)
     return pages
 
 
@@ -461,88 +500,59 @@ def get_np_type(np_type: str):
 
 
 # Autocomplete functions
+def to_choices(matches: list[tuple[str, str]]):
+    return [interactions.Choice(name=name, value=value) for name, value in matches]
+
+
 def populate_enum_list(enumName: str, input_value: str):
-    fnEnums = get_enums(enumName)
-    options = fnEnums.values()
-    filteredOptions = [
-        option for option in options
-        if (input_value.upper() in option.upper() or input_value.upper() in title_case(option).upper())
-    ]
-    choices = []
-    for option in filteredOptions[0:24]:
-        text = title_case(option)
-        choices.append(interactions.Choice(name=text, value=option))
-    return choices
+    index = autocomplete.get_index(f"enum:{enumName}", lambda: [
+        (title_case(option), option, [option, title_case(option)])
+        for option in get_enums(enumName).values()
+    ])
+    return to_choices(index.search(input_value))
 
 
 def populate_type_list(input_value: str):
-    enum_list = func_desc_dict | buff_desc_dict
-    options = enum_list.items()
-    filteredOptions = [
-        option for option in options
-        if (input_value.upper() in option[0].upper() or input_value.upper() in option[1].upper())
-    ]
-    choices = []
-    for option in filteredOptions[0:24]:
-        choices.append(interactions.Choice(name=option[1], value=option[0]))
-    return choices
+    index = autocomplete.get_index("type", lambda: [
+        (option[1], option[0], [option[0], option[1]])
+        for option in (func_desc_dict | buff_desc_dict).items()
+    ])
+    return to_choices(index.search(input_value))
 
 
 def populate_target_list(input_value: str):
-    options = target_desc_dict.items()
-    filteredOptions = [
-        option for option in options
-        if (input_value.upper() in option[0].upper() or input_value.upper() in option[1].upper())
-    ]
-    choices = []
-    for option in filteredOptions[0:24]:
-        choices.append(interactions.Choice(name=title_case(option[1]), value=option[0]))
-    return choices
+    index = autocomplete.get_index("target", lambda: [
+        (title_case(option[1]), option[0], [option[0], option[1]])
+        for option in target_desc_dict.items()
+    ])
+    return to_choices(index.search(input_value))
 
 
 def populate_traits(input_value: str):
-    traits = get_traits()
-    filteredTraits = dict(filter(lambda elem:
-        (input_value.upper() in elem[1].upper() or input_value.upper() in title_case(elem[1]).upper()),
-        traits.items()
-        )
-    )
-    choices = []
-    for trait in list(filteredTraits.items())[:24]:
-        text = title_case(trait[1])
-        choices.append(interactions.Choice(name=text, value=trait[0]))
-    return choices
+    index = autocomplete.get_index("trait", lambda: [
+        (title_case(trait[1]), trait[0], [trait[1], title_case(trait[1])])
+        for trait in get_traits().items()
+    ])
+    return to_choices(index.search(input_value))
 
 # Load CV list
 cv_list_jp = []
 cv_list_jp_en = []
-def populate_cv(input_value: str = ""):
+def build_cv_choices():
     cv_list = {}
     for (jp_cv_dict), (en_cv_dict) in zip(cv_list_jp, cv_list_jp_en):
         if jp_cv_dict.get("name") == "---": continue
         cv_list[jp_cv_dict.get("id")] = f'{jp_cv_dict.get("name")} ({en_cv_dict.get("name")})'
+    return [(name, str(id), [name]) for id, name in cv_list.items()]
 
-    matched_cvs = [
-        cv for cv in cv_list.items() if input_value.upper() in cv[1].upper()
-    ]
-
-    choices = []
-    for cv in matched_cvs[0:24]:
-        choices.append(interactions.Choice(name=cv[1], value=str(cv[0])))
-    return choices
-
-
-def get_item_list():
-    response = session.get(
-        f"https://api.atlasacademy.io/export/JP/nice_item_lang_en.json")
-    return [nice.NiceItem.parse_obj(item) for item in json.loads(response.text)]
 
+def populate_cv(input_value: str = ""):
+    return to_choices(autocomplete.get_index("cv", build_cv_choices).search(input_value))
 
-def populate_items(input_value: str = ""):
-    items = [item for item in get_item_list() if item.uses and len(item.uses) > 0]
 
-    matched_items = [item for item in items if input_value.upper() in item.name.upper() or input_value.upper() in str(item.id).upper()]
-    return [interactions.Choice(name=item.name, value=str(item.id)) for item in matched_items[0:24]]
+async def populate_items(input_value: str = ""):
+    catalog = await get_catalog("JP")
+    return to_choices(catalog.item_search.search(input_value))
 
 
 def get_cv_name(cv_id: str, region: str = "JP"):
@@ -554,8 +564,42 @@ def get_cv_name(cv_id: str, region: str = "JP"):
     return cv_name.get('name')
 
 
+async def load_cv_lists():
+    global cv_list_jp
+    global cv_list_jp_en
+    jp, jp_en = await asyncio.gather(
+        snapshot.load_export("JP", "nice_cv.json"),
+        snapshot.load_export("JP", "nice_cv_lang_en.json"),
+    )
+    if jp is not cv_list_jp or jp_en is not cv_list_jp_en:
+        cv_list_jp, cv_list_jp_en = jp, jp_en
+        autocomplete.set_index("cv", build_cv_choices())
+
+
+async def warm_up():
+    """Builds the JP catalog and the autocomplete indexes before the first command needs them."""
+    catalog = await get_catalog("JP")
+    await asyncio.to_thread(catalog.load_item_search)
+    populate_type_list("")
+    populate_target_list("")
+    populate_traits("")
+    populate_enum_list("SvtClass", "")
+
+
+async def refresh_data():
+    """Checks for new export data and rebuilds everything derived from it.
+    Commands keep being served from the previous data until the new data is ready.
+    """
+    for region in snapshot.get_regions():
+        await single_flight.do(f"revalidate:{region}", snapshot.revalidate, region)
+    await refresh_catalogs()
+    await search_index.refresh_indexes()
+    await refresh_np_charge_tables()
+    await load_cv_lists()
+
+
 def main():
-    db.init_region_db()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 
     token = os.environ.get("TOKEN")
     parser = configparser.ConfigParser()
@@ -578,15 +622,6 @@ def main():
     setup(bot)
     bot.load("interactions.ext.persistence", cipher_key="88AC2B8B21E65C3ACD467CE939E685C9")
 
-    response = session.get(
-        f"https://api.atlasacademy.io/export/JP/nice_cv.json")
-    global cv_list_jp
-    cv_list_jp = json.loads(response.text)
-    response = session.get(
-        f"https://api.atlasacademy.io/export/JP/nice_cv_lang_en.json")
-    global cv_list_jp_en
-    cv_list_jp_en = json.loads(response.text)
-
     # Commands
     @bot.command(
         name="region",
@@ -599,17 +634,17 @@ def main():
     ):
         await ctx.defer()
         if not region:
-            current_region = db.get_region(ctx.guild_id)
+            current_region = await async_db.get_region(ctx.guild_id)
             if not current_region:
                 region = "JP"
-                db.set_region(ctx.guild_id, region)
+                await async_db.set_region(ctx.guild_id, region)
                 await ctx.send(f"Server region is: \"{region}\".")
                 return
             else:
                 await ctx.send(f"Server region is: \"{current_region}\".")
                 return
 
-        db.set_region(ctx.guild_id, region)
+        await async_db.set_region(ctx.guild_id, region)
         await ctx.send(f"Server default region set to \"{region}\".")
 
 
@@ -631,16 +666,15 @@ def main():
             await ctx.send(content="Invalid input.", ephemeral=True)
             return
 
-        region = await asyncio.to_thread(check_region, ctx.guild_id, region)
+        region = await check_region(ctx.guild_id, region)
 
         await ctx.defer()
-        servants = get_servant(servantName, cv, className, region)
+        servants = await get_servant(servantName, cv, className, region)
         if servants == None or len(servants) == 0:
             await ctx.send("Not found.")
             return
         if len(servants) == 1:
-            servant = get_servant_by_id(session, servants[0].get("id"), region)
-            pages = create_servant_pages(servant, region)
+            pages = await get_servant_pages(servants[0].get("id"), region)
             await send_paginator(ctx, pages)
         else:
             options = []
@@ -692,8 +726,7 @@ def main():
         region = value[0].split(":")[1]
 
         await ctx.defer()
-        servant = get_servant_by_id(session, id, region)
-        pages = create_servant_pages(servant, region)
+        pages = await get_servant_pages(id, region)
         await ctx.message.delete()
         await send_paginator(ctx, pages)
 
@@ -781,12 +814,11 @@ def main():
             await ctx.send(content="Invalid input.", ephemeral=True)
             return
 
-        region = await asyncio.to_thread(check_region, ctx.guild_id, region)
+        region = await check_region(ctx.guild_id, region)
 
         await ctx.defer()
         friend_code = friend_code.replace(",","")
-        r = session.get(f"https://rayshift.io/api/v1/support/decks/{region}/{friend_code}")
-        data = json.loads(r.text)
+        data = await http_client.get_json(f"https://rayshift.io/api/v1/support/decks/{region}/{friend_code}")
         if data.get("status") != 200:
             if data.get("status") == 404:
                 await ctx.send(f"{data.get('message')}.\nTry visiting the [Rayshift website](https://rayshift.io/{region.lower()}/{friend_code})")
@@ -829,11 +861,13 @@ def main():
     @interactions.option(str, name="number-of-quartz", description="Number of quartz", required=True)
     @interactions.option(str, name="number-of-tickets", description="Number of tickets. Default: 0", required=False)
     @interactions.option(str, name="chance", description="Servant probability (In percent). Default: 0.8%", required=False)
+    @interactions.option(str, name="target-chance", description="Show the quartz/tickets needed for this chance (In percent)", required=False)
     async def gacha(
         ctx: interactions.CommandContext,
         number_of_quartz: str,
         number_of_tickets: str = "0",
         chance: str = "0.8",
+        target_chance: str = "",
     ):
         embed = interactions.Embed(
             title="Gacha chance",
@@ -847,23 +881,63 @@ def main():
             except ValueError:
                 return False
 
-        if not is_float(number_of_quartz) or not is_float(number_of_tickets) or not is_float(chance):
+        if (not is_float(number_of_quartz) or not is_float(number_of_tickets) or not is_float(chance) or (target_chance and not is_float(target_chance)) or
+                float(number_of_quartz) < 0 or float(number_of_tickets) < 0):
             await ctx.send(content="Invalid input.", ephemeral=True)
             return
 
-        response = session.get(
+        ce = await http_client.get_json(
             f"https://api.atlasacademy.io/nice/JP/equip/9807190")
-        ce = json.loads(response.text)
         embed.set_thumbnail(
             url=ce.get("extraAssets").get("faces").get("equip").get("9807190"),
         )
 
         await ctx.defer()
-        result_text = roll(int(number_of_quartz), int(number_of_tickets), float(chance) / 100)
+        result_text = roll(int(number_of_quartz), int(number_of_tickets), float(chance) / 100, float(target_chance) / 100 if target_chance else None)
         embed.description = result_text
         await ctx.send(embeds=embed)
 
 
+    @bot.command(
+        name="gacha-sim",
+        description="Simulate a banner with one or more rate-up servants"
+    )
+    @interactions.option(str, name="number-of-quartz", description="Number of quartz", required=True)
+    @interactions.option(str, name="number-of-tickets", description="Number of tickets. Default: 0", required=False)
+    @interactions.option(str, name="chances", description="Probability of each servant, comma separated (In percent). Default: 0.8%", required=False)
+    @interactions.option(str, name="seed", description="Random seed. Default: 0", required=False)
+    @interactions.option(str, name="tickets-count-for-spark", description="Whether ticket rolls count towards the spark. Default: Yes", required=False,
+        choices=[interactions.Choice(name="Yes", value="yes"), interactions.Choice(name="No", value="no")])
+    async def gacha_sim(
+        ctx: interactions.CommandContext,
+        number_of_quartz: str,
+        number_of_tickets: str = "0",
+        chances: str = "0.8",
+        seed: str = "0",
+        tickets_count_for_spark: str = "yes",
+    ):
+        try:
+            rates = [float(chance) / 100 for chance in chances.split(",")]
+            number_of_quartz = int(number_of_quartz)
+            number_of_tickets = int(number_of_tickets)
+            seed = int(seed)
+        except ValueError:
+            await ctx.send(content="Invalid input.", ephemeral=True)
+            return
+        if (not 0 < sum(rates) <= 1 or any(rate <= 0 for rate in rates) or len(rates) > 6 or
+                number_of_quartz < 0 or number_of_tickets < 0 or seed < 0):
+            await ctx.send(content="Invalid input.", ephemeral=True)
+            return
+
+        await ctx.defer()
+        embed = interactions.Embed(
+            title="Gacha simulation",
+            color=0xf2aba6
+        )
+        embed.description = await asyncio.to_thread(simulate_text, number_of_quartz, number_of_tickets, rates, seed, tickets_count_for_spark != "no")
+        await ctx.send(embeds=embed)
+
+
     @bot.command(
         name="np-chargers",
         description="Get all servants with NP chargers"
@@ -885,12 +959,10 @@ def main():
             await ctx.send(content="Invalid input.", ephemeral=True)
             return
 
-        region = await asyncio.to_thread(check_region, ctx.guild_id, region)
-
-        skill_lookup.init_session(session)
+        region = await check_region(ctx.guild_id, region)
 
         await ctx.defer()
-        np_chargers = await asyncio.to_thread(get_np_chargers, int(amount) * 100, class_name, region, target)
+        np_chargers = await get_np_chargers(int(amount) * 100, class_name, region, target)
         servants_list = []
         match np_type:
             case "aoe" | "st" | "other":
@@ -953,10 +1025,10 @@ def main():
         ctx: interactions.CommandContext,
         region: str = "",
     ):
-        ms.init_session(session)
         await ctx.defer()
-        region = await asyncio.to_thread(check_region, ctx.guild_id, region)
-        descs = await asyncio.to_thread(ms.get_current_weeklies, region)
+        region = await check_region(ctx.guild_id, region)
+        catalog = await get_catalog(region)
+        descs = await asyncio.to_thread(ms.get_current_weeklies, catalog, region)
         desc = "\n".join(descs)
         if len(desc) > 4096:
             desc = desc[0:4096]
@@ -1007,7 +1079,6 @@ def main():
         await ctx.message.edit(content=None, components=None, embeds=ctx.message.embeds)
         await ctx.defer()
         import quests
-        quests.init_session(session)
         final_results = await quests.get_optimized_quests(region)
         if not final_results or len(final_results) == 0:
             await ctx.send("Not found.", ephemeral=True)
@@ -1045,11 +1116,14 @@ def main():
         region: str = "",
     ):
         await ctx.defer()
-        region = await asyncio.to_thread(check_region, ctx.guild_id, region)
-        item_details = next(nice_item for nice_item in get_item_list() if str(nice_item.id) == item)
+        region = await check_region(ctx.guild_id, region)
+        item_details = (await get_catalog("JP")).items_by_id.get(int(item)) if item.isnumeric() else None
+        if not item_details:
+            await ctx.send("Not found.", ephemeral=True)
+            return
 
         from drops import get_drop_rates
-        drops_df = get_drop_rates(item_details.name, region)
+        drops_df = await get_drop_rates(item_details.name, region, item_details.id)
         if drops_df is None or drops_df.empty:
             await ctx.send("Not found.", ephemeral=True)
             return
@@ -1081,6 +1155,7 @@ def main():
         embed.add_field("/np-chargers", "Lists the NP chargers for each region")
         embed.add_field("/search", "Search for a skill or NP that meets the criteria")
         embed.add_field("/gacha", "See how likely you'll get a servant based on the number of quartz/tickets")
+        embed.add_field("/gacha-sim", "Simulate a banner with several rate-up servants and the spark")
         embed.add_field("/support", "Show a player's support list")
         await ctx.send(embeds=embed)
 
@@ -1152,12 +1227,24 @@ def main():
 
     @bot.autocomplete(command="drops", name="item")
     async def autocomplete_choice_list(ctx: interactions.CommandContext, item: str = ""):
-        await ctx.populate(populate_items(item))
+        await ctx.populate(await populate_items(item))
+
+
+    @bot.event
+    async def on_start():
+        await async_db.init_region_db()
+        await async_db.load_regions()
+        await load_cv_lists()
+        single_flight.do_in_background("warm:JP", warm_up)
+        refresh_task.start()
+        # status_task.start()
 
 
-    # @bot.event
-    # async def on_start():
-    #     status_task.start()
+    @create_task(IntervalTrigger(snapshot.VERSION_CHECK_INTERVAL))
+    async def refresh_task():
+        await refresh_data()
+        async_db.log_pool_stats()
+        single_flight.log_stats()
 
 
     # @create_task(IntervalTrigger(600))
@@ -1,64 +1,16 @@
 
-from requests_cache import CachedSession
-import json
 import time
 import datetime
 import fgo_api_types.nice as nice
-import fgo_api_types.basic as basic
 import fgo_api_types.enums as enums
 
+from catalog import Catalog
 from text_builders import title_case
 
-session = None
 
-def init_session(_session: CachedSession = CachedSession(expire_after=600)):
-    global session
-    if not session:
-        session = _session
-
-
-def load_missions(region: str = "JP") -> list[nice.NiceMasterMission]:
-    url = f"https://api.atlasacademy.io/export/{region}/nice_master_mission.json"
-    response = session.get(url)
-    missions = json.loads(response.text)
-    result = []
-    for mission in missions:
-        nice_mission = nice.NiceMasterMission.parse_obj(mission)
-        result.append(nice_mission)
-    return result
-
-
-def get_items(region: str = "JP") -> list[nice.NiceItem]:
-    if region == "JP":
-        url = f"https://api.atlasacademy.io/export/JP/nice_item_lang_en.json"
-    else:
-        url = f"https://api.atlasacademy.io/export/NA/nice_item.json"
-    response = session.get(url)
-    items = json.loads(response.text)
-    result = []
-    for item in items:
-        nice_item = nice.NiceItem.parse_obj(item)
-        result.append(nice_item)
-    return result
-
-
-def get_servants(region: str = "JP") -> list[basic.BasicServant]:
-    if region == "JP":
-        url = f"https://api.atlasacademy.io/export/JP/basic_servant_lang_en.json"
-    else:
-        url = f"https://api.atlasacademy.io/export/NA/basic_servant.json"
-    response = session.get(url)
-    servants = json.loads(response.text)
-    result = []
-    for servant in servants:
-        nice_svt = basic.BasicServant.parse_obj(servant)
-        result.append(nice_svt)
-    return result
-
-
-def get_current_weeklies(region: str = "JP"):
+def get_current_weeklies(catalog: Catalog, region: str = "JP"):
     result = []
-    master_missions = load_missions(region)
+    master_missions = catalog.master_missions
     master_missions = [mission for mission in master_missions if mission.startedAt <= int(time.time()) <= mission.endedAt]
     for master_mission in master_missions:
         start = datetime.datetime.fromtimestamp(master_mission.startedAt)
@@ -66,7 +18,7 @@ def get_current_weeklies(region: str = "JP"):
         delta = end - start
         if delta.days == 6: # Weekly
             for idx, mission in enumerate(master_mission.missions):
-                desc = describe_missions(mission, region)
+                desc = describe_missions(mission, catalog, region)
                 if idx > 0: 
                     result.append('')
                 result.append(f'**Mission {idx + 1}:**')
@@ -76,7 +28,7 @@ def get_current_weeklies(region: str = "JP"):
     return result
 
 
-def describe_missions(mission: nice.NiceEventMission, region: str = "JP"):
+def describe_missions(mission: nice.NiceEventMission, catalog: Catalog, region: str = "JP"):
     desc = []
     desc.append(mission.detail)
     for cond in mission.conds:
@@ -125,10 +77,10 @@ def describe_missions(mission: nice.NiceEventMission, region: str = "JP"):
                         classes.append(title_case(svt_class.value))
                     desc.append(f"Complete any quest {cond.targetNum} times with class [{', '.join(classes)}] in party")
                 case enums.DetailMissionCondType.ITEM_GET_BATTLE.value | enums.DetailMissionCondType.ITEM_GET_TOTAL.value:
-                    items = get_items(region)
                     target_items = []
                     for target_id in cond.detail.targetIds[0:5]:
-                        target_items.append(next(f'[{item.name}](https://apps.atlasacademy.io/db/{region}/item/{item.id})' for item in items if item.id == target_id))
+                        item = catalog.items_by_id.get(target_id)
+                        if item: target_items.append(f'[{item.name}](https://apps.atlasacademy.io/db/{region}/item/{item.id})')
                     desc.append(f"Obtain [{', '.join(target_items)}{', ...' if len(cond.detail.targetIds) > 5 else ''}] x {cond.targetNum}")
                 case enums.DetailMissionCondType.BATTLE_SVT_INDIVIDUALITY_IN_DECK.value:
                     traits = []
@@ -137,10 +89,10 @@ def describe_missions(mission: nice.NiceEventMission, region: str = "JP"):
                         traits.append(f'[{title_case(trait.value)}](https://apps.atlasacademy.io/db/{region}/entities?trait={target_id})')
                     desc.append(f"Complete any quest {cond.targetNum} times with traits [{', '.join(traits)}] in party")
                 case enums.DetailMissionCondType.BATTLE_SVT_ID_IN_DECK_1.value | enums.DetailMissionCondType.BATTLE_SVT_ID_IN_DECK_2.value:
-                    servants = get_servants(region)
                     target_servants = []
                     for target_id in cond.detail.targetIds:
-                        target_servants.append(next(f'[{svt.name}](https://apps.atlasacademy.io/db/{region}/servant/{svt.id})' for svt in servants if svt.id == target_id))
+                        svt = catalog.servants_by_id.get(target_id)
+                        if svt: target_servants.append(f'[{svt.name}](https://apps.atlasacademy.io/db/{region}/servant/{svt.id})')
                     desc.append(f"Complete any quest {cond.targetNum} times with [{', '.join(target_servants)}] in party")
                 case enums.DetailMissionCondType.SVT_GET_BATTLE.value:
                     desc.append(f"Obtain {cond.targetNum} embers")
@@ -154,11 +106,11 @@ def describe_missions(mission: nice.NiceEventMission, region: str = "JP"):
         for gift in mission.gifts:
             match gift.type:
                 case nice.NiceGiftType.servant.value | nice.NiceGiftType.eventSvtJoin.value | nice.NiceGiftType.eventSvtGet.value:
-                    servants = get_servants(region)
-                    gifts.append(next(f'[[{svt.name}](https://apps.atlasacademy.io/db/{region}/servant/{svt.id})] x {gift.num}' for svt in servants if svt.id == gift.objectId))
+                    svt = catalog.servants_by_id.get(gift.objectId)
+                    if svt: gifts.append(f'[[{svt.name}](https://apps.atlasacademy.io/db/{region}/servant/{svt.id})] x {gift.num}')
                 case nice.NiceGiftType.item.value:
-                    items = get_items(region)
-                    gifts.append(next(f'[[{item.name}](https://apps.atlasacademy.io/db/{region}/item/{item.id})] x {gift.num}' for item in items if item.id == gift.objectId))
+                    item = catalog.items_by_id.get(gift.objectId)
+                    if item: gifts.append(f'[[{item.name}](https://apps.atlasacademy.io/db/{region}/item/{item.id})] x {gift.num}')
                 # case nice.NiceGiftType.equip.value:
                 #     # TODO: mystic code
                 #     pass
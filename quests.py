@@ -1,5 +1,4 @@
 
-from requests_cache import CachedSession
 from itertools import groupby
 import json
 import time
@@ -14,17 +13,12 @@ import fgo_api_types.nice as nice
 import fgo_api_types.basic as basic
 import fgo_api_types.enums as enums
 
+import async_db
 import db
+import http_client
+from catalog import get_catalog
 from text_builders import title_case
 
-session = None
-
-def init_session(_session: CachedSession = CachedSession(expire_after=600)):
-    global session
-    if not session:
-        session = _session
-
-
 class TraitSearchQuery:
     trait_id: int | list[int]
     killcount_required: int
@@ -35,17 +29,19 @@ class TraitSearchQuery:
         self.killcount_required = killcount_required
         self.is_or = is_or
     
-    def __hash__(self):
+    @property
+    def key(self):
+        """Traits (in any order) and whether any of them is enough"""
         if isinstance(self.trait_id, list):
-            return hash(",".join(str(self.trait_id)))
+            return (frozenset(self.trait_id), self.is_or)
         else:
-            return hash(self.trait_id)
+            return (self.trait_id, self.is_or)
+
+    def __hash__(self):
+        return hash(self.key)
     
     def __eq__(self, other):
-        if isinstance(self.trait_id, list) and isinstance(other.trait_id, list):
-            return all(id in other.trait_id for id in self.trait_id) and self.is_or == other.is_or
-        else:
-            return self.trait_id == other.trait_id and self.is_or == other.is_or
+        return self.key == other.key
 
     def __repr__(self) -> str:
         return f'{self.trait_id}|{self.killcount_required}'
@@ -102,14 +98,13 @@ class QuestResult:
         return self.id == other.id
 
 
-def get_free_quests(region: str = "JP"):
+async def get_free_quests(region: str = "JP"):
     url = f"https://api.atlasacademy.io/basic/{region}/quest/phase/search?type=free&flag=displayLoopmark&lang=en"
-    response = session.get(url)
-    free_quests = json.loads(response.text)
+    free_quests = await http_client.get_json(url)
     return [basic.BasicQuestPhase.parse_obj(quest) for quest in free_quests]
 
 
-def get_free_quests_with_trait(trait_query: TraitSearchQuery, region: str = "JP") -> list[basic.BasicQuestPhase] | None:
+async def get_free_quests_with_trait(trait_query: TraitSearchQuery, region: str = "JP") -> list[basic.BasicQuestPhase] | None:
     if not trait_query or not trait_query.trait_id:
         return None
 
@@ -119,23 +114,20 @@ def get_free_quests_with_trait(trait_query: TraitSearchQuery, region: str = "JP"
         trait_querystr = f'&enemyTrait={trait_query.trait_id}'
 
     url = f"https://api.atlasacademy.io/basic/{region}/quest/phase/search?type=free&flag=displayLoopmark&lang=en{trait_querystr}"
-    response = session.get(url)
-    free_quests = json.loads(response.text)
+    free_quests = await http_client.get_json(url)
     return [basic.BasicQuestPhase.parse_obj(quest) for quest in free_quests]
 
 
-def get_quest_details(quest_id: int, region: str = "JP"):
+async def get_quest_details(quest_id: int, region: str = "JP"):
     url = f"https://api.atlasacademy.io/nice/{region}/quest/{quest_id}?lang=en"
-    response = session.get(url)
-    return nice.NiceQuest.parse_obj(json.loads(response.text))
+    return nice.NiceQuest.parse_obj(await http_client.get_json(url))
 
 
-def get_quest_phase_details(quest_id: int, phase: int, region: str = "JP"):
+async def get_quest_phase_details(quest_id: int, phase: int, region: str = "JP"):
     if region != "JP" and region != "NA":
         region = "JP" # Regions except JP and NA doesn't have enemy data
     url = f"https://api.atlasacademy.io/nice/{region}/quest/{quest_id}/{phase}?lang=en"
-    response = session.get(url)
-    return nice.NiceQuestPhase.parse_obj(json.loads(response.text))
+    return nice.NiceQuestPhase.parse_obj(await http_client.get_json(url))
 
 
 def get_quest_details_disk(file_name: str, region: str = "JP"):
@@ -144,12 +136,7 @@ def get_quest_details_disk(file_name: str, region: str = "JP"):
         return [nice.NiceQuestPhase.parse_obj(detail) for detail in all_details]
 
 
-def remove_duplicates(list):
-    return [i for n, i in enumerate(list) if i not in list[n + 1:]]
-
-
 async def main():
-    init_session()
     region = "JP"
     if len(sys.argv) > 1:
         region = str(sys.argv[1])
@@ -173,6 +160,7 @@ async def main():
         print(f'{quest.cost}AP * {count} = {quest.cost * count}AP')
         total_ap += (quest.cost * count)
     print(f"Total: {total_ap}AP")
+    await http_client.close()
 
 
 # Class ID => Trait ID
@@ -198,10 +186,8 @@ NON_SERVANT_TRAIT_ID: int = 5010
 
 async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False) -> dict[QuestResult, int]:
     master_mission_id: int
-    target_traits: list[TraitSearchQuery] = []
-    import missions
-    missions.init_session()
-    master_missions = missions.load_missions(region)
+    target_traits: dict[TraitSearchQuery, TraitSearchQuery] = {} # Equal queries share one entry, in the order they were added
+    master_missions = (await get_catalog(region)).master_missions
     master_missions = [mission for mission in master_missions if mission.startedAt <= int(time.time()) <= mission.endedAt]
     for master_mission in master_missions:
         start = datetime.datetime.fromtimestamp(master_mission.startedAt)
@@ -214,11 +200,11 @@ async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False)
                         if (cond.detail.missionCondType == enums.DetailMissionCondType.DEFEAT_ENEMY_INDIVIDUALITY.value or 
                             cond.detail.missionCondType == enums.DetailMissionCondType.ENEMY_INDIVIDUALITY_KILL_NUM.value):
                             new_target_trait = TraitSearchQuery(cond.detail.targetIds, cond.targetNum, False)
-                            existing_target_trait = next((target_trait for target_trait in target_traits if target_trait == new_target_trait), None)
+                            existing_target_trait = target_traits.get(new_target_trait)
                             if existing_target_trait: 
                                 existing_target_trait.killcount_required += (cond.targetNum - existing_target_trait.killcount_required)
                             else:
-                                target_traits.append(new_target_trait)
+                                target_traits[new_target_trait] = new_target_trait
                         elif (cond.detail.missionCondType == enums.DetailMissionCondType.DEFEAT_SERVANT_CLASS.value or 
                             cond.detail.missionCondType == enums.DetailMissionCondType.DEFEAT_ENEMY_CLASS.value or 
                             cond.detail.missionCondType == enums.DetailMissionCondType.DEFEAT_ENEMY_NOT_SERVANT_CLASS.value):
@@ -228,21 +214,21 @@ async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False)
                             if cond.detail.missionCondType == enums.DetailMissionCondType.DEFEAT_SERVANT_CLASS.value:
                                 targetids.append(SERVANT_TRAIT_ID)
                             new_target_trait = TraitSearchQuery(targetids, cond.targetNum, True)
-                            existing_target_trait = next((target_trait for target_trait in target_traits if target_trait == new_target_trait), None)
+                            existing_target_trait = target_traits.get(new_target_trait)
                             if existing_target_trait: 
                                 existing_target_trait.killcount_required += (cond.targetNum - existing_target_trait.killcount_required)
                             else:
-                                target_traits.append(new_target_trait)
+                                target_traits[new_target_trait] = new_target_trait
             master_mission_id = master_mission.id
             break
 
-    db.init_optimized_quests_db()
-    drop_data: list[db.OptimizedQuest] = db.get_optimized_quests(master_mission_id, region)
+    await async_db.init_optimized_quests_db()
+    drop_data: list[db.OptimizedQuest] = await async_db.get_optimized_quests(master_mission_id, region)
     if drop_data and len(drop_data) > 0:
         final_results: dict[QuestResult, int] = {}
         for q_id, quest_group in groupby(drop_data, lambda x: x.quest_id):
             count_foreach_target: dict[TraitSearchQuery, int] = {}
-            quest_details = get_quest_details(q_id, region)
+            quest_details = await get_quest_details(q_id, region)
             for optimized_quest in quest_group:
                 if "," in optimized_quest.target_id:
                     target_id = [int(id) for id in optimized_quest.target_id.split(",")]
@@ -262,7 +248,7 @@ async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False)
             final_results[quest_result] = optimized_quest.count
         return final_results
 
-    quests = get_free_quests(region)
+    quests = await get_free_quests(region)
 
     # Gets max phase (repeatable quest)
     quests_max_phase = [
@@ -292,8 +278,9 @@ async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False)
     # ]
 
     quest_results: list[QuestResult] = []
+    quests_enemies = await async_db.get_quests_enemies([quest.id for quest in quests_max_phase])
     for quest_basic in quests_max_phase:
-        await asyncio.to_thread(create_quest_result, quest_basic, target_traits, quest_results)
+        create_quest_result(quest_basic, target_traits, quest_results, quests_enemies.get(quest_basic.id))
 
     if len(quest_results) == 0:
         return None
@@ -305,17 +292,8 @@ async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False)
     constraints = [number_of_times >= 0] # Number of times cannot be negative
     
     for target_trait in target_traits: # target_traits is kill requirements for each trait
-        enemy_count_foreach_trait = []
-        for quest_result in quest_results:
-            has_target_trait = False
-            for trait, enemy_count in quest_result.count_foreach_trait.items():
-                # count_foreach_trait is a dictionary containing [trait - enemy count for that trait] for a activity
-                if target_trait == trait:
-                    enemy_count_foreach_trait.append(enemy_count)
-                    has_target_trait = True
-                    break
-            if not has_target_trait:
-                enemy_count_foreach_trait.append(0)
+        # count_foreach_trait is a dictionary containing [trait - enemy count for that trait] for a activity
+        enemy_count_foreach_trait = [quest_result.count_foreach_trait.get(target_trait, 0) for quest_result in quest_results]
         # Add kill count requirements to constraints
         constraints.append(enemy_count_foreach_trait @ number_of_times >= target_trait.killcount_required)
     
@@ -344,7 +322,7 @@ async def get_optimized_quests(region: str = "JP", load_from_disk: bool = False)
             optimized_quest.is_or = search_query.is_or
             optimized_quests.append(optimized_quest)
     if len(optimized_quests) > 0:
-        db.insert_optimized_quests(optimized_quests, region)
+        await async_db.insert_optimized_quests(optimized_quests, region)
 
     return final_results
 
@@ -353,8 +331,8 @@ def create_quest_result(
     quest: basic.BasicQuestPhase,
     target_traits: list[TraitSearchQuery],
     quest_results: list[QuestResult],
+    quest_enemies: list[db.QuestEnemiesTraits],
 ):
-    quest_enemies = db.get_quest_enemies(quest.id)
     if quest_enemies is None or len(quest_enemies) == 0:
         return
     quest_result = QuestResult(quest.id, quest.consume, quest.name, quest.spotName, quest.warLongName)
@@ -399,10 +377,9 @@ def create_quest_result(
     quest_results.append(quest_result)
 
 
-def init_data_from_api():
-    init_session()
+async def init_data_from_api():
     region = "JP"
-    quests = get_free_quests(region)
+    quests = await get_free_quests(region)
 
     # Gets max phase (repeatable quest)
     quests_max_phase = [
@@ -410,7 +387,7 @@ def init_data_from_api():
         for key, quest_group in groupby(quests, lambda x: x.id)
     ]
     
-    quests_with_details = [get_quest_phase_details(quest.id, quest.phase, region) for quest in quests_max_phase if quest.afterClear == nice.NiceQuestAfterClearType.repeatLast]
+    quests_with_details = await asyncio.gather(*[get_quest_phase_details(quest.id, quest.phase, region) for quest in quests_max_phase if quest.afterClear == nice.NiceQuestAfterClearType.repeatLast])
     json_text = []
     for quest in quests_with_details:
         json_text.append(quest.json())
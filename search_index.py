@@ -0,0 +1,201 @@
+import asyncio
+
+import snapshot
+from text_builders import get_skill_by_id
+
+FLAGS = ["skill", "NP"]
+SERVANT_TYPES = ["normal", "heroine"]
+
+class SkillIndex:
+    """Inverted index of servant skills and NPs.
+
+    Postings are keyed by (kind, value) and (kind, value, target) where kind is
+    "type" (funcType), "buff" (buffType), "target" (funcTargetType) or "trait" (trait ID),
+    and hold skill/NP IDs in export order.
+    Effects of skills triggered by another skill/NP are indexed under the skill/NP that triggers them.
+    """
+    region: str
+    version: str
+    source: list[dict]
+    details: dict[str, dict[int, dict]]
+    servants: dict[str, dict[int, list[dict]]]
+    postings: dict[str, dict[tuple, dict[int, None]]]
+    positions: dict[str, dict[int, int]]
+
+    def __init__(self, region: str, version: str, source: list[dict]):
+        self.region = region
+        self.version = version
+        self.source = source # Servant export the index was built from
+        self.details = {flag: {} for flag in FLAGS}
+        self.servants = {flag: {} for flag in FLAGS}
+        self.postings = {flag: {} for flag in FLAGS}
+        self.positions = {flag: {} for flag in FLAGS} # Export order
+
+    def add_posting(self, flag: str, key: tuple, id: int):
+        # Dicts keep insertion order, used as ordered sets
+        self.postings[flag].setdefault(key, {})[id] = None
+
+    def add_function(self, flag: str, id: int, function: dict, check_svals: bool = False):
+        target = function.get("funcTargetType")
+        keys = [("type", function.get("funcType")), ("target", target)]
+        for buff in function.get("buffs") or []:
+            keys.append(("buff", buff.get("type")))
+            for tval in buff.get("tvals") or []:
+                keys.append(("trait", int(tval.get("id"))))
+        for tval in (function.get("functvals") or []) + (function.get("traitVals") or []):
+            keys.append(("trait", int(tval.get("id"))))
+        if check_svals:
+            for trait_id in get_sval_traits(function):
+                keys.append(("trait", trait_id))
+
+        for key in keys:
+            self.add_posting(flag, key, id)
+            self.add_posting(flag, key + (target,), id)
+
+    def find(self, flag: str, kind: str, value: str | int, target: str = "") -> list[int]:
+        """Finds skill or NP IDs with the specified effect.
+
+        Args:
+            flag (str): "skill" or "NP"
+            kind (str): "type", "buff", "target" or "trait"
+            value (str | int): funcType, buffType, funcTargetType or trait ID
+            target (str): Effect target
+
+        Returns:
+            list: Skill/NP IDs
+        """
+        return list(self.get_posting(flag, kind, value, target))
+
+    def get_posting(self, flag: str, kind: str, value: str | int, target: str = "") -> dict[int, None]:
+        if kind == "trait":
+            value = int(value)
+        key = (kind, value, target) if target else (kind, value)
+        return self.postings[flag].get(key, {})
+
+    def find_all(self, flag: str, filters: list[tuple[str, str | int]], target: str = "") -> list[int]:
+        """Finds skill or NP IDs matching all the filters.
+        The most selective filter (smallest posting) is read first, the others are only used
+        for membership tests on its IDs, and an empty filter ends the search right away.
+
+        Args:
+            flag (str): "skill" or "NP"
+            filters (list): (kind, value), see `find`
+            target (str): Effect target
+
+        Returns:
+            list: Skill/NP IDs in export order
+        """
+        postings = []
+        for kind, value in filters:
+            posting = self.get_posting(flag, kind, value, target)
+            if not posting:
+                return []
+            postings.append(posting)
+        if len(postings) == 0:
+            return []
+        postings.sort(key=len)
+        ids = [id for id in postings[0] if all(id in posting for posting in postings[1:])]
+        # Postings of effects from triggered skills are not in export order
+        return sorted(ids, key=self.positions[flag].get)
+
+    def get_details(self, flag: str, id: int) -> dict:
+        return self.details[flag].get(id)
+
+    def get_servants(self, flag: str, id: int) -> list[dict]:
+        return self.servants[flag].get(id, [])
+
+
+def get_sval_traits(function: dict) -> set[int]:
+    """Gets the trait IDs referenced in the svals of a function (e.g. NP supereffective targets)."""
+    trait_ids = set()
+    for svals_key in ["svals", "svals2", "svals3", "svals4", "svals5"]:
+        for sval in function.get(svals_key) or []:
+            if sval.get("Target"):
+                trait_ids.add(int(sval.get("Target")))
+            for trait_id in sval.get("TargetList") or []:
+                trait_ids.add(int(trait_id))
+    return trait_ids
+
+
+def get_triggered_skill_ids(skill: dict) -> set[int]:
+    """Gets the IDs of the skills triggered by a skill or NP: the `Value` of *Function buffs (e.g. delayed effects)
+    and the `SkillID` / `TriggeredSkillId` svals of any function."""
+    skill_ids = set()
+    for function in skill.get("functions"):
+        buffs = function.get("buffs")
+        is_function_buff = bool(buffs) and buffs[0].get("type").endswith("Function")
+        for svals_key in ["svals", "svals2", "svals3", "svals4", "svals5"]:
+            for sval in function.get(svals_key) or []:
+                if is_function_buff and sval.get("Value"):
+                    skill_ids.add(int(sval.get("Value")))
+                for skill_id_key in ["SkillID", "TriggeredSkillId"]:
+                    if sval.get(skill_id_key):
+                        skill_ids.add(int(sval.get(skill_id_key)))
+    return skill_ids
+
+
+def index_servants(servants: list[dict], region: str, version: str) -> tuple[SkillIndex, dict[str, dict[int, set[int]]]]:
+    index = SkillIndex(region, version, servants)
+    triggered_skill_ids: dict[str, dict[int, set[int]]] = {flag: {} for flag in FLAGS}
+    for servant in servants:
+        if servant.get("type") not in SERVANT_TYPES or servant.get("collectionNo") == 0:
+            continue
+        servant_ref = {
+            "id": servant.get("id"),
+            "collectionNo": servant.get("collectionNo"),
+            "name": servant.get("name"),
+            "type": servant.get("type"),
+            "className": servant.get("className"),
+            "rarity": servant.get("rarity"),
+        }
+        for flag, skills in [("skill", servant.get("skills")), ("NP", servant.get("noblePhantasms"))]:
+            for skill in skills:
+                id = skill.get("id")
+                index.servants[flag].setdefault(id, []).append(servant_ref)
+                if id in index.details[flag]:
+                    continue
+                index.details[flag][id] = skill
+                index.positions[flag][id] = len(index.positions[flag])
+                for function in skill.get("functions"):
+                    index.add_function(flag, id, function, check_svals=(flag == "NP"))
+                triggered_skill_ids[flag][id] = get_triggered_skill_ids(skill)
+    return index, triggered_skill_ids
+
+
+async def build_index(region: str, version: str, servants: list[dict], previous: SkillIndex = None) -> SkillIndex:
+    index, triggered_skill_ids = await asyncio.to_thread(index_servants, servants, region, version)
+
+    # Effects of triggered skills are not part of the export, count them towards the skill/NP that triggers them.
+    # Skills that fail to load are left out rather than failing the whole index.
+    skill_ids = list(set(skill_id for flag in FLAGS for ids in triggered_skill_ids[flag].values() for skill_id in ids))
+    results = await asyncio.gather(*[get_skill_by_id(skill_id, region) for skill_id in skill_ids], return_exceptions=True)
+    triggered_skills = {skill_id: skill for skill_id, skill in zip(skill_ids, results) if isinstance(skill, dict)}
+    for flag in FLAGS:
+        for id, skill_ids in triggered_skill_ids[flag].items():
+            for skill_id in skill_ids:
+                triggered_skill = triggered_skills.get(skill_id)
+                if not triggered_skill:
+                    continue
+                for function in triggered_skill.get("functions"):
+                    index.add_function(flag, id, function)
+
+    return index
+
+
+_indexes = snapshot.VersionedStore("index", snapshot.get_servant_version, snapshot.load_servants, build_index)
+
+
+async def get_index(region: str = "JP") -> SkillIndex:
+    """Gets the skill index for a region, see `snapshot.VersionedStore`.
+
+    Args:
+        region (str): Region (Default: JP)
+
+    Returns:
+        SkillIndex: Skill index
+    """
+    return await _indexes.get(region)
+
+
+async def refresh_indexes():
+    await _indexes.refresh()
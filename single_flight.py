@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+_in_flight: dict[str, asyncio.Task] = {}
+_background: set[asyncio.Task] = set()
+_stats = {
+    "calls": 0,
+    "deduplicated": 0,
+}
+
+
+def normalize_url(url: str) -> str:
+    """Normalizes a URL so that equivalent requests share a key (e.g. query parameter order)."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+async def do(key: str, fn, *args):
+    """Runs `fn(*args)` once for all concurrent callers with the same key.
+    Callers arriving while a call is in flight wait for its result instead of starting their own.
+    They all get the same object, so the result must be treated as read-only.
+
+    Args:
+        key (str): Request key (e.g. normalized URL)
+        fn: Coroutine function
+
+    Returns:
+        Result of `fn(*args)`
+    """
+    _stats["calls"] += 1
+    task = _in_flight.get(key)
+    if task is not None:
+        _stats["deduplicated"] += 1
+    else:
+        task = asyncio.ensure_future(fn(*args))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded so that one cancelled caller does not cancel the call for the others
+    return await asyncio.shield(task)
+
+
+def do_in_background(key: str, fn, *args):
+    """Starts `do(key, fn, *args)` without waiting for the result (e.g. background refreshes).
+
+    Args:
+        key (str): Request key
+        fn: Coroutine function
+    """
+    task = asyncio.ensure_future(do(key, fn, *args))
+    _background.add(task)
+    task.add_done_callback(on_background_done)
+
+
+def on_background_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.getLogger(__name__).error("Background task failed", exc_info=task.exception())
+
+
+def get_stats() -> dict[str, int]:
+    """Gets the number of coalesced calls, how many of them were deduplicated and how many are in flight."""
+    return _stats | {"in_flight": len(_in_flight)}
+
+
+def log_stats():
+    logging.getLogger(__name__).info("Single flight: %s", get_stats())
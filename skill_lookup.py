@@ -1,248 +1,95 @@
-import requests_cache
-import json
+import asyncio
+from bisect import bisect_left
 from itertools import groupby
-from text_builders import get_servant_by_id
-
-session = None
-
-def init_session(_session: requests_cache.CachedSession = None):
-    global session
-    if not _session:
-        session = requests_cache.CachedSession(expire_after=600)
-    elif not session:
-        session = _session
-
-
-def get_skills_with_type(type: str, flag: str = "skill", target: str = "", region: str = "JP"):
-    """Get a list of skills or NP with the selected effects.
-
-    Args:
-        type (str): Effect name,
-        flag (str, optional): "skill" or "NP". Defaults to "skill".
-        target (str): Effect target
-        region (str): Region (Default: JP)
-
-    Returns:
-        A list of skill objects with the specified effect.
-    """
-    if not type:
-        return None
-    functions = get_functions(type=type, target=target, region=region)
-    found_skills = get_skills_from_functions(functions, flag, target, region)
-    if flag == "NP":
-        # One extra step for finding skills nested inside NPs (e.g. Miyu)
-        found_skills.extend(get_skills_from_functions(functions, "skill", target, region, "NP"))
-    return found_skills
-
-
-def get_skills_with_trait(trait: str, flag: str = "skill", target: str = "", region: str = "JP"):
-    """Get a list of skills or NP that are effective against the specified trait.
-
-    Args:
-        trait (str): Trait ID
-        flag (str, optional): "skill" or "NP". Defaults to "skill".
-        target (str): Effect target
-        region (str): Region (Default: JP)
-
-    Returns:
-        A list of skill objects with the specified effect.
-    """
-    if not trait:
-        return None
+import snapshot
+
+
+class NpChargeTable:
+    """Total NP charge of every servant's skills, sorted by amount for each target ("Self" or "Ally")."""
+    region: str
+    version: str
+    source: list[dict]
+    amounts: dict[str, list[int]]
+    rows: dict[str, list[dict]]
+
+    def __init__(self, region: str, version: str, servants: list[dict]):
+        self.region = region
+        self.version = version
+        self.source = servants # Servant export the table was built from
+        self.amounts = {}
+        self.rows = {}
+        for target in ["Self", "Ally"]:
+            rows = []
+            for servant in servants:
+                if servant.get("type") not in ["normal", "heroine"] or servant.get("collectionNo") == 0:
+                    continue
+                total_sval = get_total_sval(servant, (target == "Self"))
+                nps = servant.get("noblePhantasms")
+                if total_sval <= 0 or not nps or len(nps) == 0:
+                    continue
+                rows.append({
+                    "totalSvals": total_sval,
+                    "npType": get_np_type(nps[0]),
+                    "details": {
+                        "id": servant.get("id"),
+                        "collectionNo": servant.get("collectionNo"),
+                        "name": servant.get("name"),
+                        "className": servant.get("className"),
+                        "rarity": servant.get("rarity"),
+                    },
+                })
+            rows.sort(key=lambda row: row["totalSvals"])
+            self.rows[target] = rows
+            self.amounts[target] = [row["totalSvals"] for row in rows]
 
-    # Search by buffs
-    skills_by_buff = get_skills_with_buff(flag=flag, target=target, trait=trait, region=region)
+    def find(self, sval_value: int, class_name: str = "", target: str = "Self") -> list[dict]:
+        """Gets the servants with at least `sval_value` total NP charge, in ascending order."""
+        target = "Self" if target == "Self" else "Ally"
+        rows = self.rows[target][bisect_left(self.amounts[target], sval_value):]
+        if class_name:
+            rows = [row for row in rows if row["details"]["className"] == class_name]
+        return rows
 
-    result = None
 
-    # Search by functions
-    if flag == "skill":
-        functions = get_functions(target=target, trait=trait, region=region)
-        found_skills = get_skills_from_functions(functions, flag, target, region)
-        found_skills.extend(skills_by_buff)
-        result = found_skills
-    elif flag == "NP":
-        found_nps = get_nps_with_trait(trait, region)
-        found_nps.extend(skills_by_buff)
-        result = found_nps
+def get_np_type(np) -> str:
+    effect_flags = np.get("effectFlags")
+    if "attackEnemyAll" in effect_flags:
+        return "aoe"
+    elif "attackEnemyOne" in effect_flags:
+        return "st"
+    return "other"
 
-    return result
 
+async def create_np_charge_table(region: str, version: str, servants: list[dict], previous: NpChargeTable = None) -> NpChargeTable:
+    return await asyncio.to_thread(NpChargeTable, region, version, servants)
 
-def get_skills_with_buff(buff_type: str = "", flag: str = "skill", target: str = "", trait: str = "", region: str = "JP"):
-    if not buff_type and not trait:
-        return None
-    buff_query = ""
-    if buff_type:
-        buff_query = f"&type={buff_type}"
-    trait_query = ""
-    if trait:
-        trait_query = f"&tvals={trait}"
-    url = f"https://api.atlasacademy.io/basic/{region}/buff/search?reverse=true&reverseDepth=servant&reverseData=basic&lang=en&{buff_query}{trait_query}"
-    response = session.get(url)
-    buffs = json.loads(response.text)
-    skills = []
-    for buff in buffs:
-        functions = buff.get("reverse").get("basic").get("function")
-        if flag == "skill":
-            skills.extend(get_skills_from_functions(functions, "skill", target, region))
-        elif flag == "NP":
-            skills.extend(get_skills_from_functions(functions, "NP", target, region))
-            skills.extend(get_skills_from_functions(functions, "skill", target, region, "NP"))
 
-    return skills
+_np_charge_tables = snapshot.VersionedStore("np_charge", snapshot.get_servant_version, snapshot.load_servants, create_np_charge_table)
 
 
-def get_functions(type: str = "", target: str = "", trait: str = "", region: str = "JP"):
-    """Gets all the effects (functions) with the specified effect.
+async def get_np_charge_table(region: str = "JP") -> NpChargeTable:
+    """Gets the NP charge table for a region, see `snapshot.VersionedStore`.
 
     Args:
-        type (str): Effect name
-        target (str): Effect target
         region (str): Region (Default: JP)
 
     Returns:
-        A list of functions with the specified effect.
+        NpChargeTable: NP charge table
     """
-    functions = []
-    
-    if not type and not target and not trait:
-        return []
-    type_query = ""
-    if type:
-        type_query = f"&type={type}"
-    target_query = ""
-    if target:
-        target_query = f"&targetType={target}"
-    trait_query = ""
-    trait_query2 = ""
-    if trait:
-        trait_query = f"&tvals={trait}"
-        trait_query2 = f"&vals={trait}"
-    url = f"https://api.atlasacademy.io/basic/{region}/function/search?reverse=true&lang=en&reverseDepth=servant{type_query}{target_query}{trait_query}"
-    response = session.get(url)
-    functions = json.loads(response.text)
+    return await _np_charge_tables.get(region)
 
-    if trait:
-        # tvals and vals are both traits
-        url = f"https://api.atlasacademy.io/basic/{region}/function/search?reverse=true&lang=en&reverseDepth=servant{type_query}{target_query}{trait_query2}"
-        response = session.get(url)
-        functions.extend(json.loads(response.text))
 
-    return functions
+async def refresh_np_charge_tables():
+    await _np_charge_tables.refresh()
 
 
-
-def get_skills_from_functions(functions, flag: str = "skill", target: str = "", region: str = "JP", flag2: str = ""):
-    if not flag2: flag2 = flag # For searching skills triggered by NP
-    found_skills = []
-    for function in functions:
-        if target and function.get("funcTargetType") != target:
-            continue
-        for skill in function.get('reverse').get('basic').get(flag):
-            curr_skills = [skill] if flag == flag2 else []
-            if skill.get('type') == "passive":
-                continue
-            if not skill.get("ruby"):
-                # Probably a skill triggered by another skill, try to find that skill
-                triggering_skills = get_triggering_skills(skill.get("id"), flag2, region)
-                if len(triggering_skills) > 0:
-                    if flag == flag2:
-                        curr_skills.extend(triggering_skills)
-                    else:
-                        curr_skills = triggering_skills
-                else:
-                    continue
-
-            for curr_skill in curr_skills:
-                servants = curr_skill.get('reverse').get('basic').get('servant')
-                servant_found = False
-                for servant in servants:
-                    if (not servant.get('name') or
-                                servant.get('type') == "servantEquip" or
-                                servant.get('type') == "enemy" or
-                                servant.get("collectionNo") == 0
-                            ):
-                        continue
-                    servant_found = True
-                if servant_found:
-                    found_skills.append(curr_skill)
-    return found_skills
-
-
-def get_nps_with_trait(trait: str, region: str = "JP"):
-    url = f"https://api.atlasacademy.io/basic/{region}/NP/search?svalsContain={trait}&reverse=true&lang=en"
-    response = session.get(url)
-    nps = json.loads(response.text)
-    return nps
-
-
-def get_triggering_skills(id: int, flag: str = "skill", region: str = "JP"):
-    response = session.get(
-        f"https://api.atlasacademy.io/basic/{region}/{flag}/search?reverse=true&reverseData=basic&svalsContain={id}&lang=en")
-    return json.loads(response.text)
-
-
-def get_np_chargers(sval_value: int = 5000, class_name: str = "", region: str = "JP", target: str = "Self"):
-    np_charge_functions = get_functions(type="gainNp", region=region)
-    np_charge_functions_self = []
-    np_charge_functions_exceptself = []
-    for function in np_charge_functions:
-        if function.get("funcTargetType") == "self":
-            np_charge_functions_self.append(function)
-        elif "enemy" in function.get("funcTargetType"):
-            continue
-        else:
-            np_charge_functions_exceptself.append(function)
-
-    if target == "Self":
-        np_charge_skills = get_skills_from_functions(functions=np_charge_functions_self, flag="skill", region=region)
-    else:
-        np_charge_skills = get_skills_from_functions(functions=np_charge_functions_exceptself, flag="skill", region=region)
-
-    servants = []
-    for skill in np_charge_skills:
-        servants.extend(skill.get('reverse').get('basic').get('servant'))
-
-    servants = [servant for servant in servants if servant.get("collectionNo") != 0]
-
-    if class_name:
-        servants = [servant for servant in servants if servant.get("className") == class_name]
-
-    servants = remove_duplicates(servants)
-
-    servants_aoe = []
-    servants_st = []
-    servants_other = []
-
-    for servant in servants:
-        servant_details = get_servant_by_id(session, servant.get("id"), region, False)
-        total_sval = get_total_sval(servant_details, (target == "Self"))
-        if total_sval < sval_value:
-            continue
-
-        nps = servant_details.get("noblePhantasms")
-        if not nps or len(nps) == 0:
-            continue
-
-        effectFlags = nps[0].get("effectFlags")
-        if "attackEnemyAll" in effectFlags:
-            servants_aoe.append({ "totalSvals": total_sval, "details": servant })
-        elif "attackEnemyOne" in effectFlags:
-            servants_st.append({ "totalSvals": total_sval, "details": servant })
-        else:
-            servants_other.append({ "totalSvals": total_sval, "details": servant })
-    
-    np_charge_functions = None
-    np_charge_functions_self = None
-    np_charge_functions_exceptself = None
-    np_charge_skills = None
-
-    return {
-        "aoe": servants_aoe,
-        "st": servants_st,
-        "other": servants_other,
-    }
+async def get_np_chargers(sval_value: int = 5000, class_name: str = "", region: str = "JP", target: str = "Self"):
+    table = await get_np_charge_table(region)
+    np_chargers = {"aoe": [], "st": [], "other": []}
+    # One row per servant in the table, nothing to deduplicate
+    for row in table.find(sval_value, class_name, target):
+        np_chargers[row["npType"]].append({ "totalSvals": row["totalSvals"], "details": row["details"] })
+    return np_chargers
 
 
 def get_total_sval(servant, is_self: bool):
@@ -274,16 +121,3 @@ def get_total_sval(servant, is_self: bool):
                 total_sval += function.get("svals")[-1].get("Value")
     return total_sval
 
-
-def remove_duplicates(list):
-    return [i for n, i in enumerate(list) if i not in list[n + 1:]]
-
-
-def get_all_servants(region: str = "JP"):
-    if region == "JP":
-        url = "https://api.atlasacademy.io/export/JP/nice_servant_lang_en.json"
-    else:
-        url = "https://api.atlasacademy.io/export/NA/nice_servant.json"
-    response = session.get(url)
-    servants = json.loads(response.text)
-    return servants
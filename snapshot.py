@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import aiohttp
+
+import http_client
+import single_flight
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "snapshots")
+INFO_URL = "https://api.atlasacademy.io/info"
+EXPORT_URL = "https://api.atlasacademy.io/export/{region}/{file_name}"
+VERSION_CHECK_INTERVAL = 600 # Seconds between data version checks
+VALIDATORS_FILE = "validators.json" # ETag / Last-Modified of each export file in a snapshot
+
+_region_locks: dict[str, asyncio.Lock] = {}
+_versions: dict[str, str] = {}
+_last_check: dict[str, float] = {}
+_loaded: dict[tuple[str, str], tuple[str, object]] = {}
+
+
+def get_region_lock(region: str) -> asyncio.Lock:
+    return _region_locks.setdefault(region, asyncio.Lock())
+
+
+def get_region_dir(region: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, region)
+
+
+async def get_remote_versions() -> dict[str, str]:
+    """Gets the current data version (hash) for each region from Atlas Academy.
+
+    Returns:
+        dict: Region => data version
+    """
+    info = await http_client.get_json(INFO_URL, expire_after=0)
+    return {region: region_info.get("hash") for region, region_info in info.items()}
+
+
+def read_current_version(region: str) -> str | None:
+    try:
+        with open(os.path.join(get_region_dir(region), "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_current_version(region: str, version: str):
+    # Written to a temp file first so readers never see a half-written pointer
+    path = os.path.join(get_region_dir(region), "CURRENT")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(path + ".tmp", path)
+
+
+def read_validators(version_dir: str) -> dict[str, dict]:
+    try:
+        with open(os.path.join(version_dir, VALIDATORS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_validators(version_dir: str, validators: dict[str, dict]):
+    path = os.path.join(version_dir, VALIDATORS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(validators, f)
+    os.replace(path + ".tmp", path)
+
+
+def link_file(src: str, dest: str):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+async def download_export(region: str, file_name: str, dest_dir: str, validators: dict = None) -> dict | None:
+    """Downloads an export file, conditionally if the validators of a previous download are given.
+
+    Returns:
+        dict: ETag / Last-Modified of the file, None if it was not modified
+    """
+    url = EXPORT_URL.format(region=region, file_name=file_name)
+    return await http_client.download(url, os.path.join(dest_dir, file_name), validators)
+
+
+async def refresh_region(region: str, version: str):
+    """Downloads every export file of the current snapshot for the new version,
+    then switches the region over in one step.
+    Files are requested conditionally, unchanged ones are linked from the old snapshot
+    and keep their parsed content. Other files already loaded in memory are parsed
+    before the switch, so readers never wait for them.
+
+    Args:
+        region (str): Export region
+        version (str): New data version
+    """
+    region_dir = get_region_dir(region)
+    os.makedirs(region_dir, exist_ok=True)
+    old_version = read_current_version(region)
+    old_dir = os.path.join(region_dir, old_version) if old_version else None
+    file_names = []
+    old_validators = {}
+    if old_dir and os.path.isdir(old_dir):
+        file_names = [name for name in os.listdir(old_dir) if name.endswith(".json") and name != VALIDATORS_FILE]
+        old_validators = read_validators(old_dir)
+
+    staging_dir = os.path.join(region_dir, f"{version}.tmp")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    results = await asyncio.gather(*[
+        download_export(region, file_name, staging_dir, old_validators.get(file_name))
+        for file_name in file_names
+    ])
+    validators = {}
+    unchanged = set()
+    for file_name, result in zip(file_names, results):
+        if result is None:
+            link_file(os.path.join(old_dir, file_name), os.path.join(staging_dir, file_name))
+            validators[file_name] = old_validators[file_name]
+            unchanged.add(file_name)
+        else:
+            validators[file_name] = result
+    write_validators(staging_dir, validators)
+
+    version_dir = os.path.join(region_dir, version)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(staging_dir, version_dir)
+
+    loaded = {}
+    for (loaded_region, file_name), (loaded_version, data) in list(_loaded.items()):
+        if loaded_region != region or file_name not in file_names:
+            continue
+        if file_name in unchanged and loaded_version == old_version:
+            # Same object, so catalogs and indexes built from it can be reused as well
+            loaded[(region, file_name)] = (version, data)
+        else:
+            loaded[(region, file_name)] = (version, await asyncio.to_thread(read_export, os.path.join(version_dir, file_name)))
+
+    write_current_version(region, version)
+    _versions[region] = version
+    _loaded.update(loaded)
+
+    # Remove old snapshots
+    for name in os.listdir(region_dir):
+        if name != version and name != "CURRENT" and os.path.isdir(os.path.join(region_dir, name)):
+            shutil.rmtree(os.path.join(region_dir, name), ignore_errors=True)
+
+
+async def revalidate(region: str):
+    """Checks Atlas Academy for a new data version and refreshes the region if there is one.
+
+    Args:
+        region (str): Export region
+    """
+    async with get_region_lock(region):
+        _last_check[region] = time.time()
+        try:
+            remote_version = (await get_remote_versions()).get(region)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            remote_version = None
+        if remote_version and remote_version != _versions.get(region):
+            await refresh_region(region, remote_version)
+
+
+def get_regions() -> list[str]:
+    """Gets the regions that have a snapshot."""
+    return list(_versions.keys())
+
+
+async def get_version(region: str) -> str:
+    """Gets the data version currently served for a region.
+    If the version has not been checked for `VERSION_CHECK_INTERVAL` seconds,
+    the current version is still returned and the check runs in the background.
+
+    Args:
+        region (str): Export region
+
+    Returns:
+        str: Data version
+    """
+    if region not in _versions:
+        current_version = read_current_version(region)
+        if current_version:
+            _versions[region] = current_version
+            _last_check.setdefault(region, 0)
+
+    if region not in _versions:
+        # Nothing on disk yet, the first request has to wait
+        await single_flight.do(f"revalidate:{region}", revalidate, region)
+        async with get_region_lock(region):
+            if region not in _versions:
+                # Atlas Academy unreachable
+                await refresh_region(region, "latest")
+    elif time.time() - _last_check.get(region, 0) >= VERSION_CHECK_INTERVAL:
+        single_flight.do_in_background(f"revalidate:{region}", revalidate, region)
+    return _versions[region]
+
+
+def get_servant_source(region: str, detail: str = "nice") -> tuple[str, str]:
+    """Gets the servant export of a region, with English names for JP.
+
+    Args:
+        region (str): Region
+        detail (str): "nice" or "basic" (Default: nice)
+
+    Returns:
+        tuple: (Export region, export file name)
+    """
+    if region == "JP":
+        return ("JP", f"{detail}_servant_lang_en.json")
+    return (region, f"{detail}_servant.json")
+
+
+def read_export(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def read_snapshot_file(region: str, version: str, file_name: str):
+    version_dir = os.path.join(get_region_dir(region), version)
+    path = os.path.join(version_dir, file_name)
+    async with get_region_lock(region):
+        if not os.path.exists(path):
+            os.makedirs(version_dir, exist_ok=True)
+            validators = await download_export(region, file_name, version_dir)
+            write_validators(version_dir, read_validators(version_dir) | {file_name: validators})
+    data = await asyncio.to_thread(read_export, path)
+    _loaded[(region, file_name)] = (version, data)
+    return data
+
+
+async def load_export(region: str, file_name: str):
+    """Loads an export file from the local snapshot, downloading it once per data version.
+    Concurrent loads of the same file share one download and parse.
+
+    Args:
+        region (str): Export region
+        file_name (str): Export file name (e.g. nice_item_lang_en.json)
+
+    Returns:
+        Parsed JSON content of the export file
+    """
+    version = await get_version(region)
+    loaded = _loaded.get((region, file_name))
+    if loaded and loaded[0] == version:
+        return loaded[1]
+    return await single_flight.do(f"export:{region}/{version}/{file_name}", read_snapshot_file, region, version, file_name)
+
+
+async def get_servant_version(region: str) -> str:
+    return await get_version(get_servant_source(region)[0])
+
+
+async def load_servants(region: str):
+    return await load_export(*get_servant_source(region))
+
+
+class VersionedStore:
+    """Objects built from export data, one per region, rebuilt when the data version changes.
+    Until the new object is ready (built in the background), the previous one is still returned.
+    Objects have a `version` and the `source` data they were built from;
+    one whose source did not change with the new version is kept as is.
+    """
+    name: str
+
+    def __init__(self, name: str, get_version, load, build):
+        """
+        Args:
+            name (str): Name, prefix of the single flight keys
+            get_version: Coroutine function (region) => data version
+            load: Coroutine function (region) => source data
+            build: Coroutine function (region, version, source, previous object or None) => object
+        """
+        self.name = name
+        self._get_version = get_version
+        self._load = load
+        self._build = build
+        self._objects = {}
+
+    def get_key(self, region: str, version: str) -> str:
+        return f"{self.name}:{region}:{version}"
+
+    async def get(self, region: str):
+        """Gets the object of a region, for the current (or previous) data version."""
+        version = await self._get_version(region)
+        obj = self._objects.get(region)
+        if obj is None:
+            obj = await single_flight.do(self.get_key(region, version), self.create, region, version)
+        elif obj.version != version:
+            single_flight.do_in_background(self.get_key(region, version), self.create, region, version)
+        return obj
+
+    async def create(self, region: str, version: str):
+        source = await self._load(region)
+        previous = self._objects.get(region)
+        if previous is not None and previous.source is source:
+            # Source data not modified since the previous version
+            previous.version = version
+            return previous
+        obj = await self._build(region, version, source, previous)
+        self._objects[region] = obj
+        return obj
+
+    async def refresh(self):
+        """Rebuilds the object of every loaded region whose data version changed."""
+        for region in list(self._objects.keys()):
+            version = await self._get_version(region)
+            if self._objects[region].version != version:
+                await single_flight.do(self.get_key(region, version), self.create, region, version)
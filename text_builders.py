@@ -1,9 +1,10 @@
-import requests_cache
-import json
 import re
+import asyncio
 from enum import Flag
 import fgo_api_types.enums as enums
 
+import http_client
+
 SUB = str.maketrans("0123456789", "₀₁₂₃₄₅₆₇₈₉")
 
 class NpFunctionType(Flag):
@@ -48,7 +49,71 @@ def get_np_function_type(function) -> NpFunctionType:
     return NpFunctionType.NONE
 
 
-def get_skill_description(session: requests_cache.CachedSession, skill, sub_skill: bool = False, region: str = "JP"):
+def get_function_dependencies(function, region: str = "JP") -> dict[str, tuple]:
+    """Gets what `get_skill_description` looks up to describe a function:
+    "sub_skill" (skill or NP whose effects are listed under the function) and "depend_function".
+
+    Args:
+        function: Function object
+        region (str, optional): Region. Defaults to "JP".
+
+    Returns:
+        dict: Dependency => (lookup function, ID, region)
+    """
+    dependencies = {}
+    if function.get("funcTargetTeam") == "enemy" or function.get("funcType") == "none" or not function.get("svals"):
+        return dependencies
+    sval = function.get("svals")[0]
+    buff_type = function.get("buffs")[0].get("type") if function.get("buffs") and len(function.get("buffs")) > 0 else ""
+    if sval.get("Value") and buff_type.endswith("Function"):
+        dependencies["sub_skill"] = (get_skill_by_id, sval.get("Value"), "JP")
+    elif not sval.get("Value") and buff_type == "counterFunction":
+        dependencies["sub_skill"] = (get_np_by_id, sval.get("CounterId"), region)
+    if function.get("funcType") == "moveState":
+        dependencies["depend_function"] = (get_function_by_id, sval.get("DependFuncId"), region)
+    return dependencies
+
+
+def get_skill_dependencies(skill, region: str = "JP") -> list[tuple]:
+    """Gets the skills, NPs and functions that `get_skill_description` looks up for a skill.
+
+    Returns:
+        list: (Lookup function, ID, region)
+    """
+    return [
+        dependency
+        for function in skill.get("functions")
+        for dependency in get_function_dependencies(function, region).values()
+    ]
+
+
+async def get_dependency(dependency: tuple):
+    fn, id, region = dependency
+    return await fn(id, region)
+
+
+async def prefetch_skill_dependencies(skills: list, region: str = "JP"):
+    """Fetches everything the descriptions of the skills depend on concurrently, level by level,
+    so that rendering them only hits the response cache. Call it once per render with all the skills.
+
+    Args:
+        skills (list): Skill or NP objects
+        region (str, optional): Region. Defaults to "JP".
+    """
+    fetched = set()
+    while skills:
+        dependencies = []
+        for skill in skills:
+            for dependency in get_skill_dependencies(skill, region):
+                if dependency not in fetched:
+                    fetched.add(dependency)
+                    dependencies.append(dependency)
+        results = await asyncio.gather(*[fn(id, dependency_region) for fn, id, dependency_region in dependencies])
+        # Only sub-skills and NPs can have dependencies of their own
+        skills = [result for (fn, _, _), result in zip(dependencies, results) if result and fn is not get_function_by_id]
+
+
+async def get_skill_description(skill, sub_skill: bool = False, region: str = "JP"):
     skill_descs = []
     if not sub_skill and skill.get("coolDown"): skill_descs.append(f'**Base Cooldown: ** {skill.get("coolDown")[0]}')
     is_np = False
@@ -60,6 +125,8 @@ def get_skill_description(session: requests_cache.CachedSession, skill, sub_skil
         if func_type == "none": continue
 
         svals_level = function.get("svals")
+        if not svals_level: continue
+        dependencies = get_function_dependencies(function, region)
         sval_rate = svals_level[0].get("Rate")
         sval_turns = svals_level[0].get("Turn")
         sval_count = svals_level[0].get("Count")
@@ -104,8 +171,8 @@ def get_skill_description(session: requests_cache.CachedSession, skill, sub_skil
         if sval_value:
             valuesTextList = []
             if buff_type.endswith("Function"):
-                func_skill = get_skill_by_id(session, sval_value)
-                func_skill_desc = get_skill_description(session=session, skill=func_skill, sub_skill=True, region=region)
+                func_skill = await get_dependency(dependencies["sub_skill"])
+                func_skill_desc = await get_skill_description(skill=func_skill, sub_skill=True, region=region)
                 values_text += func_skill_desc
             elif all(sval.get("Value") == svals_level[0].get("Value") for sval in svals_level):
                 # All values stay the same on NP level up
@@ -146,9 +213,8 @@ def get_skill_description(session: requests_cache.CachedSession, skill, sub_skil
         else:
             if buff_type == "counterFunction":
                 # Bazett
-                counter_id = svals_level[0].get("CounterId")
-                func_skill = get_np_by_id(session, counter_id, region)
-                func_skill_desc = get_skill_description(session=session, skill=func_skill, sub_skill=True, region=region)
+                func_skill = await get_dependency(dependencies["sub_skill"])
+                func_skill_desc = await get_skill_description(skill=func_skill, sub_skill=True, region=region)
                 values_text += func_skill_desc
 
         is_multiple_rates = False
@@ -258,8 +324,7 @@ def get_skill_description(session: requests_cache.CachedSession, skill, sub_skil
             skill_descs.append(f'**{sub_skill_text}Effect {funcIdx + 1}**: {previous_function_text}{function_effect}{inline_value_text} [{", ".join(traitvals_text)}] to [{func_target_text}]{target_vals_text} {turns_count_text}')
         elif func_type == "moveState":
             # Lady Avalon, Van Gogh, ...
-            depend_func_id = svals_level[0].get("DependFuncId")
-            depend_func = get_function_by_id(session, depend_func_id, region)
+            depend_func = await get_dependency(dependencies["depend_function"])
             traitvals = depend_func.get("traitVals")
             traitvals_text = []
             for tval in traitvals:
@@ -343,7 +408,7 @@ def get_trait_desc(trait_id: str | int, region: str = "JP"):
     return f'[{trait_name}]({url})'
 
 
-def get_function_by_id(session: requests_cache.CachedSession, id: int, region: str = "JP"):
+async def get_function_by_id(id: int, region: str = "JP"):
     """Get function by ID
 
     Args:
@@ -353,16 +418,15 @@ def get_function_by_id(session: requests_cache.CachedSession, id: int, region: s
     Returns:
         Function object
     """
-    response = session.get(
+    function = await http_client.get_json(
         f"https://api.atlasacademy.io/nice/{region}/function/{id}?lang=en")
-    function = json.loads(response.text)
     if function.get('detail') == "Function not found":
         return None
     else:
         return function
 
 
-def get_skill_by_id(session: requests_cache.CachedSession, id: int, region: str = "JP"):
+async def get_skill_by_id(id: int, region: str = "JP"):
     """Get skill by ID
 
     Args:
@@ -372,16 +436,15 @@ def get_skill_by_id(session: requests_cache.CachedSession, id: int, region: str
     Returns:
         Skill object
     """
-    response = session.get(
+    skill = await http_client.get_json(
         f"https://api.atlasacademy.io/nice/{region}/skill/{id}?lang=en")
-    skill = json.loads(response.text)
     if skill.get('detail') == "Skill not found":
         return None
     else:
         return skill
 
 
-def get_np_by_id(session: requests_cache.CachedSession, id: int, region: str = "JP"):
+async def get_np_by_id(id: int, region: str = "JP"):
     """Get NP by ID
 
     Args:
@@ -391,16 +454,19 @@ def get_np_by_id(session: requests_cache.CachedSession, id: int, region: str = "
     Returns:
         Skill object
     """
-    response = session.get(
+    skill = await http_client.get_json(
         f"https://api.atlasacademy.io/nice/{region}/NP/{id}?lang=en")
-    skill = json.loads(response.text)
     if skill.get('detail') == "NP not found":
         return None
     else:
         return skill
 
 
-def get_servant_by_id(session, id: int, region: str = "JP", lore: bool = True):
+def get_servant_url(id: int, region: str = "JP", lore: bool = True) -> str:
+    return f'https://api.atlasacademy.io/nice/{region}/svt/{id}?lore={"true" if lore else "false"}&lang=en'
+
+
+async def get_servant_by_id(id: int, region: str = "JP", lore: bool = True):
     """Get servant by ID
 
     Args:
@@ -410,9 +476,7 @@ def get_servant_by_id(session, id: int, region: str = "JP", lore: bool = True):
     Returns:
         Servant object
     """
-    response = session.get(
-        f'https://api.atlasacademy.io/nice/{region}/svt/{id}?lore={"true" if lore else "false"}&lang=en')
-    servant = json.loads(response.text)
+    servant = await http_client.get_json(get_servant_url(id, region, lore))
     if servant.get('detail') == "Svt not found":
         return None
     else: